@@ -21,7 +21,7 @@ start = timezone.make_aware(datetime(2025, 12, 16, 0, 0, 0))
 end = timezone.make_aware(datetime(2026, 1, 1, 0, 0, 0))
 
 dec_items = LineItem.objects.filter(
-    product_name__icontains='Through Bear',
+    product__royalty_bearing=True,
     order__order_date__gte=start,
     order__order_date__lt=end
 )
@@ -39,7 +39,7 @@ for month in range(10, 13):
     else:
         m_end = timezone.make_aware(datetime(2025, month+1, 1, 0, 0, 0))
     items = LineItem.objects.filter(
-        product_name__icontains='Through Bear',
+        product__royalty_bearing=True,
         order__order_date__gte=m_start,
         order__order_date__lt=m_end
     )
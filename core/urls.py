@@ -6,5 +6,6 @@ urlpatterns = [
     path('', views.homepage, name='homepage'),
     path('analytics/', views.analytics, name='analytics'),
     path('api/analytics/', views.analytics_api, name='analytics_api'),
+    path('api/analytics/query/', views.analytics_query, name='analytics_query'),
     path('dashboard/', RedirectView.as_view(pattern_name='dashboard', permanent=False)),
 ]
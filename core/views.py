@@ -1,11 +1,13 @@
 from django.shortcuts import render
 from django.contrib.auth.decorators import login_required
-from django.db.models import Sum, Count
-from django.db.models.functions import TruncDate, TruncMonth, TruncWeek
+from django.db.models import Q
 from django.utils import timezone
 from django.http import JsonResponse
-from datetime import timedelta
+from datetime import date, timedelta
 from decimal import Decimal
+from orders.caching import cache_by_version
+from orders.periods import SHOP_TIMEZONE, day_range, day_start, shop_today
+from orders.models import DataVersion
 
 
 def homepage(request):
@@ -13,6 +15,20 @@ def homepage(request):
     return render(request, 'core/homepage.html')
 
 
+def selected_products(request, sales):
+    """
+    The products analytics report on: every variant of the titles given as
+    `product` parameters, else the royalty-bearing books. Returns their ids
+    in the sales engine (None if a title is unknown) and a LineItem filter.
+    """
+    titles = request.GET.getlist('product')
+    if not titles:
+        return sales.product_ids(royalty_bearing=True), Q(product__royalty_bearing=True)
+    if not set(titles) <= {product.title for product in sales.products.values()}:
+        return None, None
+    return sales.product_ids(titles=titles), Q(product__title__in=titles)
+
+
 @login_required
 def analytics(request):
     """Analytics dashboard for Through Bear's Eyes sales."""
@@ -20,15 +36,20 @@ def analytics(request):
 
 
 @login_required
+@cache_by_version(DataVersion.ORDERS, per_user=False)
 def analytics_api(request):
-    """API endpoint for Through Bear's Eyes analytics data."""
+    """
+    API endpoint for Through Bear's Eyes analytics data, or for the titles
+    given as `product` parameters.
+    """
     from orders.models import LineItem
+    from orders.sales import sales_engine
     
     # Get query parameters
     period = request.GET.get('period', 'month')  # day, week, month, year
     order_type = request.GET.get('type', 'all')  # all, preorder, regular
     
-    today = timezone.now().date()
+    today = shop_today()
     
     # Calculate date range based on period
     if period == 'day':
@@ -48,37 +69,20 @@ def analytics_api(request):
         prev_start = today - timedelta(days=730)
         prev_end = start_date
     
-    # Build base queryset for Through Bear's Eyes
-    def get_bear_items(start, end=None, order_type='all'):
-        """Get Through Bear's Eyes line items filtered by type."""
-        qs = LineItem.objects.filter(
-            product_name__icontains='Through Bear'
-        )
-        
-        if end:
-            qs = qs.filter(
-                order__order_date__date__gte=start,
-                order__order_date__date__lt=end
-            )
-        else:
-            qs = qs.filter(order__order_date__date__gte=start)
-        
-        if order_type == 'preorder':
-            qs = qs.filter(product_name__icontains='Pre-Order')
-        elif order_type == 'regular':
-            qs = qs.exclude(product_name__icontains='Pre-Order')
-        
-        return qs
-    
-    # Current period stats
-    current_items = get_bear_items(start_date, order_type=order_type)
-    current_qty = current_items.aggregate(total=Sum('quantity'))['total'] or 0
-    current_orders = current_items.values('order').distinct().count()
-    
-    # Previous period stats for comparison
-    prev_items = get_bear_items(prev_start, prev_end, order_type=order_type)
-    prev_qty = prev_items.aggregate(total=Sum('quantity'))['total'] or 0
-    prev_orders = prev_items.values('order').distinct().count()
+    # Totals and chart come from the in-memory sales columns, not the database;
+    # toggling periods and types reuses the cached queries they share
+    sales = sales_engine.refresh()
+    bear_products, bear_items = selected_products(request, sales)
+    if bear_products is None:
+        return JsonResponse({'error': 'Unknown product'}, status=400)
+    preorder = {'preorder': True, 'regular': False}.get(order_type)
+    current = sales.query(day_start(start_date), None, product_ids=bear_products, preorder=preorder)
+    previous = sales.query(day_start(prev_start), day_start(prev_end), product_ids=bear_products, preorder=preorder)
+    all_time = sales.query(product_ids=bear_products, preorder=preorder)
+    current_qty = current['quantity']
+    current_orders = current['orders']
+    prev_qty = previous['quantity']
+    prev_orders = previous['orders']
     
     # Calculate percentage changes
     qty_change = 0
@@ -89,69 +93,38 @@ def analytics_api(request):
     if prev_orders > 0:
         order_change = round(((current_orders - prev_orders) / prev_orders) * 100, 1)
     
-    # All-time stats
-    all_time_items = LineItem.objects.filter(product_name__icontains='Through Bear')
-    if order_type == 'preorder':
-        all_time_items = all_time_items.filter(product_name__icontains='Pre-Order')
-    elif order_type == 'regular':
-        all_time_items = all_time_items.exclude(product_name__icontains='Pre-Order')
-    
-    all_time_qty = all_time_items.aggregate(total=Sum('quantity'))['total'] or 0
-    all_time_orders = all_time_items.values('order').distinct().count()
-    
-    # Pre-order vs Regular breakdown (for all time)
-    preorder_total = LineItem.objects.filter(
-        product_name__icontains='Through Bear'
-    ).filter(
-        product_name__icontains='Pre-Order'
-    ).aggregate(total=Sum('quantity'))['total'] or 0
-    
-    regular_total = LineItem.objects.filter(
-        product_name__icontains='Through Bear'
-    ).exclude(
-        product_name__icontains='Pre-Order'
-    ).aggregate(total=Sum('quantity'))['total'] or 0
-    
-    # Chart data - sales over time within the period
-    chart_items = get_bear_items(start_date, order_type=order_type)
-    
+    # Chart data - sales over time within the period, up to the end of today
     if period == 'day':
-        # Hourly breakdown not available, just show total
-        chart_data = [{'label': today.strftime('%d %b'), 'value': current_qty}]
-    elif period == 'week':
-        # Daily breakdown
-        daily_data = chart_items.annotate(
-            date=TruncDate('order__order_date')
-        ).values('date').annotate(
-            total=Sum('quantity')
-        ).order_by('date')
-        chart_data = [{'label': d['date'].strftime('%a %d'), 'value': d['total']} for d in daily_data if d['date']]
-    elif period == 'month':
-        # Daily breakdown
-        daily_data = chart_items.annotate(
-            date=TruncDate('order__order_date')
-        ).values('date').annotate(
-            total=Sum('quantity')
-        ).order_by('date')
-        chart_data = [{'label': d['date'].strftime('%d %b'), 'value': d['total']} for d in daily_data if d['date']]
+        bucket, label_format = 'hour', '%H:00'
+    elif period in ('week', 'month'):
+        bucket, label_format = 'day', '%a %d' if period == 'week' else '%d %b'
     else:  # year
-        # Monthly breakdown
-        monthly_data = chart_items.annotate(
-            month=TruncMonth('order__order_date')
-        ).values('month').annotate(
-            total=Sum('quantity')
-        ).order_by('month')
-        chart_data = [{'label': d['month'].strftime('%b %Y'), 'value': d['total']} for d in monthly_data if d['month']]
+        bucket, label_format = 'month', '%b %Y'
+    series = sales.query(
+        day_start(start_date), day_start(today + timedelta(days=1)), bucket, bear_products, preorder
+    )['series']
+    chart_data = [{'label': edge.strftime(label_format), 'value': total} for edge, total in series]
     
     # Recent sales list
-    recent_items = get_bear_items(start_date, order_type=order_type).select_related('order').order_by('-order__order_date')[:20]
+    # A datetime bound (not __date) so the newest orders are read off the order_date index.
+    # Joined to the product rather than product_id IN (...), so SQLite walks
+    # the newest orders and stops after 20 instead of sorting every book sale
+    recent_items = LineItem.objects.filter(
+        bear_items,
+        order__order_date__gte=day_start(start_date),
+    )
+    if order_type == 'preorder':
+        recent_items = recent_items.filter(product__is_preorder=True)
+    elif order_type == 'regular':
+        recent_items = recent_items.filter(product__is_preorder=False)
+    recent_items = recent_items.select_related('order', 'product').order_by('-order__order_date')[:20]
     recent_sales = [{
         'order_number': item.order.order_number,
         'customer': item.order.customer_name,
         'product': item.product_name,
         'quantity': item.quantity,
-        'date': item.order.order_date.strftime('%d %b %Y %H:%M') if item.order.order_date else 'N/A',
-        'is_preorder': 'Pre-Order' in item.product_name
+        'date': timezone.localtime(item.order.order_date, SHOP_TIMEZONE).strftime('%d %b %Y %H:%M') if item.order.order_date else 'N/A',
+        'is_preorder': item.product.is_preorder
     } for item in recent_items]
     
     return JsonResponse({
@@ -164,13 +137,71 @@ def analytics_api(request):
             'order_change': order_change,
         },
         'all_time': {
-            'books_sold': all_time_qty,
-            'orders': all_time_orders,
+            'books_sold': all_time['quantity'],
+            'orders': all_time['orders'],
         },
         'breakdown': {
-            'preorder': preorder_total,
-            'regular': regular_total,
+            'preorder': sales.query(product_ids=bear_products, preorder=True)['quantity'],
+            'regular': sales.query(product_ids=bear_products, preorder=False)['quantity'],
         },
         'chart': chart_data,
         'recent_sales': recent_sales,
     })
+
+
+# Longest range each granularity may be asked for, in days
+QUERY_MAX_DAYS = {'hour': 31, 'day': 3 * 366, 'week': 10 * 366, 'month': 10 * 366}
+
+
+@login_required
+def analytics_query(request):
+    """
+    Sales of any products over any date range: `product` (titles, repeatable;
+    default the royalty-bearing books), `start` and `end` (shop dates,
+    inclusive; default the last 30 days), `granularity` (hour, day, week or
+    month) and `type` (all, preorder or regular).
+
+    Answered from the in-memory sales engine, whose results are cached per
+    orders version, so repeated views of the same range don't recompute.
+    """
+    from orders.sales import sales_engine
+    
+    granularity = request.GET.get('granularity', 'day')
+    order_type = request.GET.get('type', 'all')
+    try:
+        end_date = date.fromisoformat(request.GET['end']) if 'end' in request.GET else shop_today()
+        start_date = (
+            date.fromisoformat(request.GET['start']) if 'start' in request.GET
+            else end_date - timedelta(days=30)
+        )
+    except ValueError:
+        return JsonResponse({'error': 'start and end must be dates (YYYY-MM-DD)'}, status=400)
+    if granularity not in QUERY_MAX_DAYS:
+        return JsonResponse({'error': 'granularity must be hour, day, week or month'}, status=400)
+    if order_type not in ('all', 'preorder', 'regular'):
+        return JsonResponse({'error': 'type must be all, preorder or regular'}, status=400)
+    if start_date > end_date:
+        return JsonResponse({'error': 'start must not be after end'}, status=400)
+    if (end_date - start_date).days >= QUERY_MAX_DAYS[granularity]:
+        return JsonResponse(
+            {'error': f'{granularity} data covers at most {QUERY_MAX_DAYS[granularity]} days'}, status=400
+        )
+    
+    sales = sales_engine.refresh()
+    product_ids, _ = selected_products(request, sales)
+    if product_ids is None:
+        return JsonResponse({'error': 'Unknown product'}, status=400)
+    preorder = {'preorder': True, 'regular': False}.get(order_type)
+    start, end = day_range(start_date, end_date)
+    result = sales.query(start, end, granularity, product_ids, preorder)
+    
+    return JsonResponse({
+        'products': sorted({sales.products[pk].title for pk in product_ids}),
+        'start': start_date.isoformat(),
+        'end': end_date.isoformat(),
+        'granularity': granularity,
+        'order_type': order_type,
+        'books_sold': result['quantity'],
+        'orders': result['orders'],
+        'chart': [{'start': edge.isoformat(), 'value': total} for edge, total in result['series']],
+    })
@@ -84,6 +84,24 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/6.0/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Rendered pages keyed by data version (orders/caching.py), so entries never
+    # go stale; per process, use FileBasedCache to share them between workers
+    'pages': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'pages',
+        'TIMEOUT': 600,
+        'OPTIONS': {'MAX_ENTRIES': 500},
+    },
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
 
@@ -1,3 +1,9 @@
 from django.contrib import admin
+from .models import Product
 
-# Register your models here.
+
+@admin.register(Product)
+class ProductAdmin(admin.ModelAdmin):
+    list_display = ['name', 'sku', 'title', 'is_preorder', 'royalty_bearing']
+    list_filter = ['is_preorder', 'royalty_bearing']
+    search_fields = ['name', 'sku', 'title']
@@ -0,0 +1,158 @@
+import csv
+import io
+import os
+import random
+import resource
+import sys
+import time
+from datetime import datetime, timedelta
+
+from django.core.management import call_command
+from django.db import connection, connections
+
+from .instrumentation import QueryCounter
+from .periods import SHOP_TIMEZONE
+
+
+SHOPIFY_COLUMNS = [
+    'Name', 'Email', 'Financial Status', 'Paid at', 'Fulfillment Status', 'Fulfilled at',
+    'Accepts Marketing', 'Currency', 'Subtotal', 'Shipping', 'Taxes', 'Total',
+    'Discount Code', 'Discount Amount', 'Shipping Method', 'Created at',
+    'Lineitem quantity', 'Lineitem name', 'Lineitem price', 'Lineitem sku',
+    'Lineitem requires shipping', 'Lineitem taxable', 'Lineitem fulfillment status',
+    'Billing Name', 'Shipping Name', 'Shipping Street', 'Shipping Address1', 'Shipping Address2',
+    'Shipping Company', 'Shipping City', 'Shipping Zip', 'Shipping Province', 'Shipping Country',
+    'Shipping Phone', 'Notes', 'Payment Method', 'Vendor', 'Id',
+]
+
+# (name, sku, price, weight) - the book and its pre-order variants dominate sales
+PRODUCTS = [
+    ("Through Bear's Eyes", 'TBE-HB', 12.99, 40),
+    ("Through Bear's Eyes - Pre-Order", 'TBE-PRE', 12.99, 25),
+    ("Through Bear's Eyes - Signed Pre-Order", 'TBE-PRE-SIGNED', 15.99, 8),
+    ("Through Bear's Eyes - Signed", 'TBE-SIGNED', 15.99, 10),
+    ('Bear Bookmark', 'BM-BEAR', 2.50, 10),
+    ('Tote Bag', 'TOTE-01', 8.00, 5),
+    ('Gift Wrapping', '', 1.50, 2),
+]
+
+FIRST_NAMES = ['Amelia', 'Oliver', 'Isla', 'George', 'Ava', 'Noah', 'Mia', 'Arthur', 'Freya', 'Leo']
+LAST_NAMES = ['Smith', 'Jones', 'Taylor', 'Brown', 'Williams', 'Wilson', 'Evans', 'Thomas', 'Roberts', 'Walker']
+CITIES = ['London', 'Manchester', 'Bristol', 'Leeds', 'Glasgow', 'Cardiff', 'York', 'Bath']
+
+
+def generate_shopify_export(path, rows, seed=1, start=datetime(2025, 10, 1)):
+    """
+    Write a synthetic Shopify orders export with exactly `rows` line item rows.
+
+    Orders span one to four rows, with order-level columns only on the first
+    row as Shopify does, and occasionally repeat a SKU on two rows. 'Created
+    at' is in shop local time, so timestamps switch between +0100 and +0000
+    at the BST boundaries. Rows are streamed to disk, so memory stays flat.
+    """
+    rng = random.Random(seed)
+    names = [p[0] for p in PRODUCTS]
+    weights = [p[3] for p in PRODUCTS]
+    by_name = {p[0]: p for p in PRODUCTS}
+
+    created = start.replace(tzinfo=SHOP_TIMEZONE)
+    order_number = 1001
+    written = 0
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=SHOPIFY_COLUMNS, restval='')
+        writer.writeheader()
+        while written < rows:
+            created += timedelta(seconds=rng.randint(30, 1800))
+            created_at = created.astimezone(SHOP_TIMEZONE).strftime('%Y-%m-%d %H:%M:%S %z')
+            lines = rng.choices(names, weights, k=rng.choice([1, 1, 1, 2, 2, 3, 4]))
+            if len(lines) > 1 and rng.random() < 0.1:
+                lines.append(lines[0])  # Same SKU listed on two rows
+            lines = lines[:rows - written]
+            quantities = [rng.choice([1, 1, 1, 2, 3]) for _ in lines]
+            subtotal = sum(by_name[name][2] * qty for name, qty in zip(lines, quantities))
+            customer = f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}'
+            fulfilled = rng.random() < 0.6
+            address1 = f'{rng.randint(1, 200)} High Street'
+
+            for i, (name, quantity) in enumerate(zip(lines, quantities)):
+                _, sku, price, _ = by_name[name]
+                row = {
+                    'Name': f'#{order_number}',
+                    'Created at': created_at,
+                    'Lineitem quantity': quantity,
+                    'Lineitem name': name,
+                    'Lineitem price': f'{price:.2f}',
+                    'Lineitem sku': sku,
+                    'Lineitem requires shipping': 'true',
+                    'Lineitem taxable': 'true',
+                    'Lineitem fulfillment status': 'fulfilled' if fulfilled else 'pending',
+                    'Vendor': 'The Little Library',
+                }
+                if i == 0:
+                    # Shopify only fills order-level columns on an order's first row
+                    row.update({
+                        'Email': f'customer{order_number}@example.com',
+                        'Financial Status': 'paid',
+                        'Paid at': created_at,
+                        'Fulfillment Status': 'fulfilled' if fulfilled else 'unfulfilled',
+                        'Fulfilled at': created_at if fulfilled else '',
+                        'Accepts Marketing': 'no',
+                        'Currency': 'GBP',
+                        'Subtotal': f'{subtotal:.2f}',
+                        'Shipping': '3.99',
+                        'Taxes': '0.00',
+                        'Total': f'{subtotal + 3.99:.2f}',
+                        'Discount Amount': '0',
+                        'Shipping Method': 'Royal Mail 2nd Class',
+                        'Billing Name': customer,
+                        'Shipping Name': customer,
+                        'Shipping Street': address1,
+                        'Shipping Address1': address1,
+                        'Shipping Address2': rng.choice(['', '', 'Flat 2']),
+                        'Shipping City': rng.choice(CITIES),
+                        'Shipping Zip': f'{rng.choice("ABCLMS")}{rng.randint(1, 20)} {rng.randint(1, 9)}XY',
+                        'Shipping Country': 'GB',
+                        'Payment Method': 'Shopify Payments',
+                        'Id': 5000000000 + order_number,
+                    })
+                writer.writerow(row)
+            written += len(lines)
+            order_number += 1
+    return path
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux but in bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def run_import_benchmark(csv_path, db_path, rows, import_options):
+    """
+    Import `csv_path` into a freshly migrated SQLite database at `db_path`.
+
+    Meant to run in its own process, so peak RSS covers a single import.
+    Returns a dict of metrics for the run.
+    """
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    connections.close_all()
+    connection.settings_dict['NAME'] = db_path
+    call_command('migrate', verbosity=0)
+
+    counter = QueryCounter()
+    started = time.perf_counter()
+    with connection.execute_wrapper(counter):
+        call_command('import_orders', path=csv_path, stdout=io.StringIO(), verbosity=0, **import_options)
+    elapsed = time.perf_counter() - started
+    connections.close_all()
+
+    return {
+        'rows': rows,
+        'seconds': round(elapsed, 3),
+        'rows_per_second': round(rows / elapsed, 1),
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+        'sql_statements': counter.count,
+        'sql_seconds': round(counter.duration, 3),
+    }
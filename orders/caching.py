@@ -0,0 +1,63 @@
+import hashlib
+from functools import wraps
+from django.contrib import messages
+from django.core.cache import caches
+from django.http import HttpResponse
+from .models import DataVersion
+from .periods import shop_today
+
+
+# Cache alias holding rendered pages, see CACHES in settings
+PAGE_CACHE = 'pages'
+
+
+def data_versions(keys):
+    """Current version of each DataVersion key, in one query."""
+    found = dict(DataVersion.objects.filter(key__in=keys).values_list('key', 'version'))
+    return [found.get(key, 0) for key in keys]
+
+
+def page_cache_key(request, view_name, versions, per_user):
+    parts = [view_name, shop_today().isoformat(), *map(str, versions)]
+    parts += [f'{name}={value}' for name, values in sorted(request.GET.lists()) for value in values]
+    if per_user:
+        # Pages embed the user and a CSRF token derived from their cookie
+        parts += [str(request.user.pk), request.META.get('CSRF_COOKIE', '')]
+    return 'page:' + hashlib.sha256('\n'.join(parts).encode()).hexdigest()
+
+
+def cache_by_version(*version_keys, per_user=True):
+    """
+    Cache a GET view's 200 responses under the current versions of
+    `version_keys`, today's date and the query string, so an entry is only
+    reused until the data it was rendered from changes.
+
+    The versions are read before the view runs: anything written while it
+    renders moves the version on, and later requests miss and re-render.
+    Requests with pending flash messages always render. Put this below the
+    login decorators so access is still checked on every request.
+    """
+    def decorator(view):
+        view_name = f'{view.__module__}.{view.__qualname__}'
+
+        @wraps(view)
+        def wrapped(request, *args, **kwargs):
+            if request.method != 'GET' or len(messages.get_messages(request)):
+                return view(request, *args, **kwargs)
+            if per_user and not request.META.get('CSRF_COOKIE'):
+                # First visit: the page is about to issue the CSRF cookie
+                return view(request, *args, **kwargs)
+
+            cache = caches[PAGE_CACHE]
+            key = page_cache_key(request, view_name, data_versions(version_keys), per_user)
+            cached = cache.get(key)
+            if cached is not None:
+                content, content_type = cached
+                return HttpResponse(content, content_type=content_type)
+
+            response = view(request, *args, **kwargs)
+            if response.status_code == 200 and not response.streaming:
+                cache.set(key, (response.content, response['Content-Type']))
+            return response
+        return wrapped
+    return decorator
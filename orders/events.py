@@ -0,0 +1,49 @@
+import asyncio
+import threading
+
+
+class OrderEventBroadcaster:
+    """
+    Fans order change events out to the Server-Sent Events streams connected
+    to this process.
+
+    Events are published from whichever thread saved the order (sync views run
+    in a worker thread under ASGI) and handed to each subscriber's event loop
+    with call_soon_threadsafe. Each subscriber only keeps the latest event:
+    pages just need to know that something changed, not every intermediate
+    state.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = set()
+
+    def subscribe(self):
+        """Register a queue on the running event loop and return it."""
+        queue = asyncio.Queue(maxsize=1)
+        with self._lock:
+            self._subscribers.add((asyncio.get_running_loop(), queue))
+        return queue
+
+    def unsubscribe(self, queue):
+        with self._lock:
+            self._subscribers = {(loop, q) for loop, q in self._subscribers if q is not queue}
+
+    def publish(self, event):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(self._deliver, queue, event)
+            except RuntimeError:
+                # The subscriber's loop has shut down
+                self.unsubscribe(queue)
+
+    @staticmethod
+    def _deliver(queue, event):
+        if queue.full():
+            queue.get_nowait()
+        queue.put_nowait(event)
+
+
+broadcaster = OrderEventBroadcaster()
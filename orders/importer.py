@@ -0,0 +1,448 @@
+import hashlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+
+import django
+import numpy as np
+import pandas as pd
+from django.db import transaction
+from django.utils import timezone
+
+from .instrumentation import StageTimer
+from .models import Order, LineItem, Product, DataVersion, OrderStats
+
+
+DEFAULT_BATCH_SIZE = 1000
+DEFAULT_CHUNK_SIZE = 10000
+
+# Orders placed this long before the last import's watermark are still fully
+# re-checked, since Shopify orders are mostly edited (fulfilled, refunded,
+# readdressed) in the days after they are placed
+WATERMARK_OVERLAP = timedelta(days=14)
+
+# Shopify date format like '2025-10-11 16:57:10 +0100'
+SHOPIFY_DATE_FORMAT = '%Y-%m-%d %H:%M:%S %z'
+
+# Only the Shopify export columns the importer actually uses are parsed.
+IMPORT_COLUMNS = [
+    'Name', 'Created at', 'Currency', 'Subtotal', 'Fulfillment Status',
+    'Lineitem name', 'Lineitem sku', 'Lineitem quantity',
+    'Shipping Name', 'Shipping Address1', 'Shipping Address2', 'Shipping City', 'Shipping Zip',
+]
+
+
+def read_csv_chunks(source, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Stream a Shopify export as DataFrames of `chunk_size` rows.
+
+    `source` is a path or an open file object. Only one chunk is held in
+    memory at once, so memory stays flat regardless of the export size.
+    """
+    # Note: We need to handle potential string/float issues with Zip codes or Phone numbers if we use them
+    reader = pd.read_csv(source, dtype=str, usecols=IMPORT_COLUMNS, chunksize=chunk_size)
+    with reader:
+        yield from reader
+
+
+def normalize_chunk(chunk):
+    """
+    Reduce raw export rows to one record per order and one per line item.
+
+    Everything is done with column operations, before any database access.
+    Returns two DataFrames in order of first appearance:
+
+    - orders, indexed by order number, with customer_name, shipping_address,
+      subtotal, currency, is_fulfilled, order_date (UTC, NaT if missing) and
+      the number of export rows the order came from
+    - items, with order_number, product_name, sku and the summed quantity
+
+    Within an order, the first row with a Shipping Name provides the customer
+    details, the first non-zero Subtotal and the first valid 'Created at'
+    win, mirroring the merge rules applied to existing orders.
+    """
+    chunk = chunk[chunk['Name'].notna()]
+    text = chunk.fillna('')
+
+    address = (
+        text['Shipping Address1'] + ' ' + text['Shipping Address2'] + ' ' +
+        text['Shipping City'] + ' ' + text['Shipping Zip']
+    ).str.strip()
+    subtotal = pd.to_numeric(chunk['Subtotal'], errors='coerce')
+    has_name = chunk['Shipping Name'].notna()
+
+    columns = pd.DataFrame({
+        'order_number': chunk['Name'],
+        'customer_name': chunk['Shipping Name'],
+        'named_address': address.where(has_name),
+        'address': address,
+        'subtotal': subtotal.where(subtotal != 0),
+        'currency': chunk['Currency'],
+        'fulfillment_status': chunk['Fulfillment Status'],
+        'order_date': pd.to_datetime(chunk['Created at'], format=SHOPIFY_DATE_FORMAT, utc=True, errors='coerce'),
+    })
+    grouped = columns.groupby('order_number', sort=False)
+    first = grouped.first()
+    first_row = grouped.nth(0).set_index('order_number').reindex(first.index)
+
+    orders = pd.DataFrame({
+        'customer_name': first['customer_name'].fillna(''),
+        'shipping_address': first['named_address'].fillna(first_row['address']),
+        'subtotal': first['subtotal'].fillna(0.0),
+        'currency': first_row['currency'].fillna('GBP'),
+        'is_fulfilled': first_row['fulfillment_status'] == 'fulfilled',
+        'order_date': first['order_date'],
+        'rows': grouped.size(),
+    })
+
+    has_item = chunk['Lineitem name'].notna()
+    quantity = np.trunc(pd.to_numeric(chunk['Lineitem quantity'], errors='coerce')).fillna(1).astype(int)
+    items = pd.DataFrame({
+        'order_number': chunk['Name'],
+        'product_name': chunk['Lineitem name'],
+        'sku': text['Lineitem sku'],
+        'quantity': quantity,
+    })[has_item]
+    items = items.groupby(['order_number', 'product_name', 'sku'], sort=False, as_index=False)['quantity'].sum()
+
+    return orders, items
+
+
+def iter_order_chunks(chunks):
+    """
+    Re-cut a stream of chunks on order boundaries.
+
+    The rows of the last order in each chunk are held back and prepended to
+    the next one, so every yielded chunk contains complete orders and can be
+    normalized independently of its neighbours.
+    """
+    carry = None
+    for chunk in chunks:
+        if carry is not None:
+            chunk = pd.concat([carry, chunk], ignore_index=True)
+        names = chunk['Name'].dropna()
+        if names.empty:
+            carry = chunk
+            continue
+        # Position of the last row that doesn't belong to the trailing order
+        boundary = np.flatnonzero(chunk['Name'].ne(names.iloc[-1]).to_numpy())
+        split = boundary[-1] + 1 if len(boundary) else 0
+        if split:
+            yield chunk.iloc[:split]
+        carry = chunk.iloc[split:]
+    if carry is not None and not carry.empty:
+        yield carry
+
+
+def _normalize_with_count(chunk):
+    return (*normalize_chunk(chunk), len(chunk))
+
+
+def import_in_parallel(importer, chunks, workers, max_pending=None):
+    """
+    Normalize chunks in a pool of `workers` processes and write them here.
+
+    SQLite only allows one writer, so only the CPU-bound parsing is spread
+    across processes; this process is the single writer and consumes the
+    results in export order. Chunks are cut on order boundaries first, so an
+    order never spans two workers. At most `max_pending` chunks (twice the
+    worker count by default) are in flight; reading blocks until the writer
+    catches up, which keeps memory bounded.
+    """
+    max_pending = max_pending or workers * 2
+    in_flight = deque()
+    with ProcessPoolExecutor(max_workers=workers, initializer=django.setup) as pool:
+        for chunk in iter_order_chunks(chunks):
+            in_flight.append(pool.submit(_normalize_with_count, chunk))
+            if len(in_flight) >= max_pending:
+                with importer.timer.stage('normalize'):
+                    result = in_flight.popleft().result()
+                importer.add_normalized(*result)
+        while in_flight:
+            with importer.timer.stage('normalize'):
+                result = in_flight.popleft().result()
+            importer.add_normalized(*result)
+
+
+def file_checksum(path):
+    """SHA-256 of a file, read in blocks so large exports aren't loaded into memory."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ChecksumReader:
+    """Wraps a binary stream such as stdin and hashes everything read through it."""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.digest = hashlib.sha256()
+
+    def read(self, size=-1):
+        data = self.stream.read(size)
+        self.digest.update(data)
+        return data
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        line = self.stream.readline()
+        if not line:
+            raise StopIteration
+        self.digest.update(line)
+        return line
+
+    def hexdigest(self):
+        return self.digest.hexdigest()
+
+
+def merge_order(order, incoming):
+    """
+    Apply the import merge rules of `incoming` onto `order`.
+
+    Blank customer details are filled in, a zero subtotal is replaced and a
+    missing order_date is backfilled. Returns True if `order` was changed.
+    """
+    has_changes = False
+    if not order.customer_name and incoming.customer_name:
+        order.customer_name = incoming.customer_name
+        order.shipping_address = incoming.shipping_address
+        has_changes = True
+
+    if order.subtotal == 0 and incoming.subtotal:
+        order.subtotal = incoming.subtotal
+        has_changes = True
+
+    if not order.order_date and incoming.order_date:
+        order.order_date = incoming.order_date
+        has_changes = True
+
+    return has_changes
+
+
+class OrderImporter:
+    """
+    Batched writer for Shopify order exports.
+
+    Chunks are normalized with normalize_chunk() and the resulting orders
+    are collected in memory and flushed every `batch_size` orders, so an
+    order is grouped correctly even when its rows arrive in different CSV
+    chunks. On flush, existing orders and line items are resolved with one
+    query each, then written with bulk_create/bulk_update inside a single
+    transaction.
+
+    Re-imports are idempotent: line item quantities are set from the export
+    rather than added to, and only orders or items that actually differ are
+    written. Given the `watermark` of earlier runs, orders placed more than
+    WATERMARK_OVERLAP before it are settled: those already in the database
+    are left as they are without looking up or comparing their line items,
+    while missing ones are still imported however old they are.
+
+    Time spent in each stage (normalize, prepare, lookup_orders, write_orders,
+    lookup_items, write_items) is recorded on `timer`.
+    """
+
+    ORDER_UPDATE_FIELDS = ['customer_name', 'shipping_address', 'subtotal', 'order_date', 'updated_at', 'version']
+
+    def __init__(self, batch_size=DEFAULT_BATCH_SIZE, watermark=None, timer=None):
+        self.batch_size = batch_size
+        self.timer = timer or StageTimer()
+        self.cutoff = watermark - WATERMARK_OVERLAP if watermark else None
+        self.max_created_at = None
+        self.pending = {}  # order_number -> (Order, {(product_name, sku): quantity})
+        self.applied = set()  # order numbers already written by this run
+        self.version = None  # DataVersion of the current flush, once bumped
+        self.stats = {
+            'rows': 0,
+            'skipped_rows': 0,
+            'settled_orders': 0,
+            'orders_created': 0,
+            'orders_updated': 0,
+            'items_created': 0,
+            'items_merged': 0,
+        }
+
+    def add_chunk(self, chunk):
+        """Normalize a chunk of raw export rows and queue its orders for writing."""
+        with self.timer.stage('normalize'):
+            orders, items = normalize_chunk(chunk)
+        self.add_normalized(orders, items, len(chunk))
+
+    def add_normalized(self, orders, items, row_count):
+        """Queue the output of normalize_chunk() for a chunk of `row_count` rows."""
+        self.stats['rows'] += row_count
+        # Rows without an order number
+        self.stats['skipped_rows'] += row_count - int(orders['rows'].sum())
+
+        if not orders.empty:
+            latest = orders['order_date'].max()
+            if not pd.isna(latest) and (self.max_created_at is None or latest > self.max_created_at):
+                self.max_created_at = latest.to_pydatetime()
+
+        if self.cutoff is not None:
+            orders, items = self._drop_settled(orders, items)
+
+        with self.timer.stage('prepare'):
+            items_by_order = {}
+            for order_number, product_name, sku, quantity in items.itertuples(index=False):
+                items_by_order.setdefault(order_number, {})[(product_name, sku)] = quantity
+
+            incoming = [
+                Order(
+                    order_number=row.Index,
+                    customer_name=row.customer_name,
+                    shipping_address=row.shipping_address,
+                    subtotal=row.subtotal,
+                    currency=row.currency,
+                    is_fulfilled=row.is_fulfilled,
+                    order_date=None if pd.isna(row.order_date) else row.order_date.to_pydatetime(),
+                )
+                for row in orders.itertuples()
+            ]
+
+        for order in incoming:
+            self.add_order(order, items_by_order.get(order.order_number, {}))
+
+    def _drop_settled(self, orders, items):
+        """`orders` and `items` without the settled orders already in the database."""
+        # An order continuing from an earlier chunk is merged however old it is
+        continuing = list(self.pending) + list(self.applied)
+        settled = orders.index[(orders['order_date'] < self.cutoff) & ~orders.index.isin(continuing)]
+        if settled.empty:
+            return orders, items
+        with self.timer.stage('lookup_orders'):
+            known = Order.objects.in_bulk(list(settled), field_name='order_number')
+        if known:
+            self.stats['settled_orders'] += len(known)
+            orders = orders[~orders.index.isin(list(known))]
+            items = items[~items['order_number'].isin(list(known))]
+        return orders, items
+
+    def add_order(self, incoming, items):
+        """Queue an unsaved order and its {(product_name, sku): quantity} items."""
+        order_number = incoming.order_number
+        if order_number in self.pending:
+            order, pending_items = self.pending[order_number]
+            merge_order(order, incoming)
+            for key, quantity in items.items():
+                pending_items[key] = pending_items.get(key, 0) + quantity
+            return
+
+        # Rows of one order are contiguous in Shopify exports, so only flush
+        # on an order boundary to keep each order inside a single batch.
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+        self.pending[order_number] = (incoming, dict(items))
+
+    def flush(self):
+        if not self.pending:
+            return
+        self.version = None
+        with transaction.atomic():
+            orders = self._write_orders()
+            self._write_line_items(orders)
+        self.applied.update(self.pending)
+        self.pending = {}
+
+    def _next_version(self):
+        """
+        DataVersion stamped on the orders written by this flush. Bulk writes
+        skip the model signals, so the counter is bumped here, once per flush
+        and only if something is written.
+        """
+        if self.version is None:
+            self.version = DataVersion.bump()
+        return self.version
+
+    def _write_orders(self):
+        """Create or merge the pending orders. Returns saved orders by order_number."""
+        with self.timer.stage('lookup_orders'):
+            existing = Order.objects.in_bulk(list(self.pending), field_name='order_number')
+
+        to_create = []
+        to_update = []
+        stats = {}  # OrderStats changes, applied once for the whole batch
+        now = timezone.now()
+        for order_number, (incoming, _items) in self.pending.items():
+            order = existing.get(order_number)
+            if order is None:
+                to_create.append(incoming)
+                OrderStats.add(stats, OrderStats.key(incoming), 1, incoming.subtotal)
+                continue
+            old_subtotal = order.subtotal
+            if merge_order(order, incoming):
+                order.updated_at = now
+                to_update.append(order)
+                OrderStats.add(stats, OrderStats.key(order), 0, OrderStats.amount(order.subtotal) - old_subtotal)
+
+        with self.timer.stage('write_orders'):
+            for order in to_create + to_update:
+                order.version = self._next_version()
+            if to_create:
+                Order.objects.bulk_create(to_create, batch_size=self.batch_size)
+                existing.update(Order.objects.in_bulk(
+                    [order.order_number for order in to_create], field_name='order_number'
+                ))
+            if to_update:
+                Order.objects.bulk_update(to_update, self.ORDER_UPDATE_FIELDS, batch_size=self.batch_size)
+            OrderStats.apply(stats)
+
+        self.stats['orders_created'] += len(to_create)
+        self.stats['orders_updated'] += len(to_update)
+        return existing
+
+    def _write_line_items(self, orders):
+        existing = {}
+        order_ids = [order.id for order in orders.values()]
+        with self.timer.stage('lookup_items'):
+            for item in LineItem.objects.filter(order_id__in=order_ids).order_by('id'):
+                existing.setdefault((item.order_id, item.product_name, item.sku), item)
+
+        to_create = []
+        to_update = []
+        changed_order_ids = set()
+        new_products = set()  # (product_name, sku) of the items to create
+        for order_number, (_incoming, items) in self.pending.items():
+            order = orders[order_number]
+            for (product_name, sku), quantity in items.items():
+                item = existing.get((order.id, product_name, sku))
+                if item:
+                    if order_number in self.applied:
+                        # Order continues from an earlier batch of this run
+                        item.quantity += quantity
+                    elif item.quantity != quantity:
+                        # The export holds the full quantity, so re-imports don't double it
+                        item.quantity = quantity
+                    else:
+                        continue
+                    to_update.append(item)
+                    changed_order_ids.add(order.id)
+                else:
+                    changed_order_ids.add(order.id)
+                    to_create.append(LineItem(
+                        order=order,
+                        product_name=product_name,
+                        quantity=quantity,
+                        sku=sku
+                    ))
+                    new_products.add((product_name, sku))
+
+        with self.timer.stage('write_items'):
+            if to_create:
+                products = Product.resolve_many(new_products)
+                for item in to_create:
+                    item.product = products[(item.product_name, item.sku)]
+                LineItem.objects.bulk_create(to_create, batch_size=self.batch_size)
+            if to_update:
+                LineItem.objects.bulk_update(to_update, ['quantity'], batch_size=self.batch_size)
+            if changed_order_ids:
+                # bulk_create/bulk_update bypass auto_now, so bump the orders explicitly
+                Order.objects.filter(id__in=changed_order_ids).update(
+                    updated_at=timezone.now(), version=self._next_version()
+                )
+
+        self.stats['items_created'] += len(to_create)
+        self.stats['items_merged'] += len(to_update)
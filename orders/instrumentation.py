@@ -0,0 +1,87 @@
+import time
+from contextlib import contextmanager
+
+
+class QueryCounter:
+    """Execute wrapper counting the SQL statements run on a connection and their total time."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+
+
+class StageTimer:
+    """Accumulates wall-clock seconds and call counts per named stage."""
+
+    def __init__(self):
+        self.seconds = {}
+        self.calls = {}
+
+    @contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[name] = self.seconds.get(name, 0.0) + time.perf_counter() - started
+            self.calls[name] = self.calls.get(name, 0) + 1
+
+    def iterate(self, name, iterable):
+        """Yield from `iterable`, timing each step under `name`."""
+        iterator = iter(iterable)
+        while True:
+            with self.stage(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def summary(self):
+        return {
+            name: {'seconds': round(seconds, 4), 'calls': self.calls[name]}
+            for name, seconds in self.seconds.items()
+        }
+
+
+class ProgressReporter:
+    """
+    Live progress line (rows, rows/sec and ETA) written to a stream such as stderr.
+
+    ETA is estimated from bytes read when the total size is known, and
+    updates are throttled to one every `interval` seconds.
+    """
+
+    def __init__(self, stream, total_bytes=None, interval=0.5):
+        self.stream = stream
+        self.total_bytes = total_bytes
+        self.interval = interval
+        self.started = time.monotonic()
+        self.last_update = 0.0
+
+    def update(self, rows, bytes_read=None, force=False):
+        now = time.monotonic()
+        if not force and now - self.last_update < self.interval:
+            return
+        self.last_update = now
+        elapsed = max(now - self.started, 1e-9)
+
+        line = f'{rows} rows, {rows / elapsed:.0f} rows/s'
+        if self.total_bytes and bytes_read:
+            fraction = min(bytes_read / self.total_bytes, 1.0)
+            eta = elapsed * (1 - fraction) / fraction
+            line += f', {fraction:.0%}, ETA {eta:.0f}s'
+        self.stream.write(f'\r{line}'.ljust(60), ending='')
+        self.stream.flush()
+
+    def finish(self, rows):
+        self.update(rows, force=True)
+        self.stream.write('')
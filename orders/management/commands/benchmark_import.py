@@ -0,0 +1,101 @@
+import json
+import multiprocessing
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+import django
+from django.core.management.base import BaseCommand, CommandError
+from orders.benchmark import generate_shopify_export, run_import_benchmark
+from orders.importer import DEFAULT_BATCH_SIZE, DEFAULT_CHUNK_SIZE
+
+
+class Command(BaseCommand):
+    help = 'Benchmark import_orders against synthetic Shopify exports of increasing size'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes',
+            type=int,
+            nargs='+',
+            default=[1000, 10000, 100000, 1000000],
+            help='Export sizes to benchmark, in CSV rows',
+        )
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+        parser.add_argument('--workers', type=int, default=1)
+        parser.add_argument(
+            '--output-dir',
+            help='Where generated exports and databases are written (default: a temporary directory)',
+        )
+        parser.add_argument(
+            '--json',
+            help='Write the results to this JSON file',
+        )
+        parser.add_argument(
+            '--compare',
+            help='JSON results of an earlier run; fail if rows/sec dropped by more than --tolerance',
+        )
+        parser.add_argument(
+            '--tolerance',
+            type=float,
+            default=0.2,
+            help='Allowed fractional regression in rows/sec or SQL statements when using --compare',
+        )
+
+    def handle(self, *args, **options):
+        import_options = {
+            'batch_size': options['batch_size'],
+            'chunk_size': options['chunk_size'],
+            'workers': options['workers'],
+        }
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            output_dir = options['output_dir'] or tmp_dir
+            os.makedirs(output_dir, exist_ok=True)
+
+            results = []
+            # Each run gets its own process so peak RSS is measured per import
+            context = multiprocessing.get_context('spawn')
+            for rows in options['sizes']:
+                csv_path = os.path.join(output_dir, f'orders_{rows}.csv')
+                if not os.path.exists(csv_path):
+                    self.stderr.write(f'Generating {rows} row export...')
+                    generate_shopify_export(csv_path, rows)
+                db_path = os.path.join(output_dir, f'benchmark_{rows}.sqlite3')
+
+                with ProcessPoolExecutor(1, mp_context=context, initializer=django.setup) as pool:
+                    result = pool.submit(run_import_benchmark, csv_path, db_path, rows, import_options).result()
+                results.append(result)
+                self.stdout.write(
+                    f"{rows:>9} rows  {result['seconds']:>8.2f}s  {result['rows_per_second']:>10.0f} rows/s  "
+                    f"{result['peak_rss_mb']:>7.1f} MB peak RSS  {result['sql_statements']:>7} SQL statements"
+                )
+
+        if options['json']:
+            with open(options['json'], 'w') as f:
+                json.dump({'options': import_options, 'results': results}, f, indent=2)
+
+        if options['compare']:
+            self.compare(results, options['compare'], options['tolerance'])
+
+    def compare(self, results, baseline_path, tolerance):
+        with open(baseline_path) as f:
+            baseline = {r['rows']: r for r in json.load(f)['results']}
+
+        regressions = []
+        for result in results:
+            before = baseline.get(result['rows'])
+            if before is None:
+                continue
+            if result['rows_per_second'] < before['rows_per_second'] * (1 - tolerance):
+                regressions.append(
+                    f"{result['rows']} rows: {before['rows_per_second']:.0f} -> {result['rows_per_second']:.0f} rows/s"
+                )
+            if result['sql_statements'] > before['sql_statements'] * (1 + tolerance):
+                regressions.append(
+                    f"{result['rows']} rows: {before['sql_statements']} -> {result['sql_statements']} SQL statements"
+                )
+
+        if regressions:
+            raise CommandError('Import performance regressed:\n' + '\n'.join(regressions))
+        self.stdout.write(self.style.SUCCESS('No regressions against baseline'))
@@ -0,0 +1,121 @@
+from datetime import date
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import RequestFactory
+from core.views import analytics_api
+from orders.models import Order
+from orders.views import order_list, simplified_view, dashboard
+from payments.models import PaymentPeriod
+
+
+class QueryRecorder:
+    """Execute wrapper keeping the SELECT statements run on a connection, with their params."""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        if not many and sql.lstrip().upper().startswith('SELECT'):
+            self.queries.append((sql, params))
+        return execute(sql, params, many, context)
+
+
+def plan_problems(detail, limited):
+    """What is wrong with one EXPLAIN QUERY PLAN step, if anything."""
+    if detail.startswith('SCAN') and not any(ok in detail for ok in ('VIRTUAL TABLE', 'sqlite_master')):
+        if 'INDEX' not in detail:
+            return 'full table scan'
+        # Walking an index in ORDER BY order is fine when a LIMIT stops it early
+        if not limited:
+            return 'full index scan'
+    if 'USE TEMP B-TREE' in detail:
+        return 'temp b-tree sort'
+    return None
+
+
+class Command(BaseCommand):
+    help = 'Run EXPLAIN QUERY PLAN over the queries issued by the hot views and flag full scans and temp sorts'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--fail-on-problems',
+            action='store_true',
+            help='Exit with an error if any query plan has a full scan or temp b-tree sort',
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('explain_queries only understands SQLite query plans')
+
+        problems = 0
+        for label, run in self.workloads():
+            recorder = QueryRecorder()
+            with connection.execute_wrapper(recorder):
+                run()
+
+            self.stdout.write(self.style.MIGRATE_HEADING(label))
+            seen = set()
+            for sql, params in recorder.queries:
+                if sql in seen:
+                    continue
+                seen.add(sql)
+                problems += self.explain(sql, params, options['verbosity'])
+            self.stdout.write('')
+
+        if problems:
+            message = f'{problems} query plan step(s) flagged'
+            if options['fail_on_problems']:
+                raise CommandError(message)
+            self.stdout.write(self.style.WARNING(message))
+        else:
+            self.stdout.write(self.style.SUCCESS('No full scans or temp b-tree sorts'))
+
+    def explain(self, sql, params, verbosity):
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            steps = cursor.fetchall()
+
+        limited = ' LIMIT ' in sql.upper()
+        flagged = [(detail, plan_problems(detail, limited)) for _, _, _, detail in steps]
+        count = sum(1 for _, problem in flagged if problem)
+        if verbosity >= 2 or (count and verbosity >= 1):
+            self.stdout.write(f'  {sql[:200]}' if verbosity < 3 else f'  {sql}')
+        for detail, problem in flagged:
+            if problem:
+                self.stdout.write(self.style.WARNING(f'    {detail}  <- {problem}'))
+            elif verbosity >= 2:
+                self.stdout.write(f'    {detail}')
+        return count
+
+    def workloads(self):
+        """(label, callable) pairs issuing the same queries as the views they are named after."""
+        factory = RequestFactory()
+        # Unsaved superuser: enough for user_passes_test/login_required without touching the session
+        user = User(username='explain', is_superuser=True, is_staff=True)
+        cursor_id = Order.objects.values_list('id', flat=True).order_by('id').first() or 1
+
+        def view(func, path, **params):
+            def run():
+                request = factory.get(path, params)
+                request.user = user
+                func(request)
+            return run
+
+        for status in ('unpacked', 'packed'):
+            for sort in ('oldest', 'newest', 'value_high', 'value_low'):
+                yield f'order_list status={status} sort={sort}', view(order_list, '/orders/', status=status, sort=sort)
+                yield (
+                    f'order_list status={status} sort={sort} next page',
+                    view(order_list, '/orders/', status=status, sort=sort, view_all='true', after=cursor_id, fragment='1'),
+                )
+        yield 'order_list search', view(order_list, '/orders/', q='smith')
+        yield 'simplified_view', view(simplified_view, '/orders/simplified/')
+        yield 'simplified_view next', view(simplified_view, '/orders/simplified/', after=cursor_id, sort='newest')
+        yield 'dashboard', view(dashboard, '/orders/dashboard/')
+        for period in ('day', 'week', 'month', 'year'):
+            yield f'analytics_api period={period}', view(analytics_api, '/api/analytics/', period=period)
+
+        today = date.today()
+        period = PaymentPeriod(start_date=today.replace(day=1), end_date=today, payment_due_date=today)
+        yield 'PaymentPeriod.books_sold', lambda: period.books_sold
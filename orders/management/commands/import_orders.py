@@ -1,126 +1,149 @@
-import pandas as pd
+import json
+import sys
+import time
 from django.core.management.base import BaseCommand
-from orders.models import Order, LineItem
-import os
-from datetime import datetime
+from django.db import connection
 from django.utils import timezone
-
-
-def parse_shopify_date(date_str):
-    """Parse Shopify date format like '2025-10-11 16:57:10 +0100'"""
-    if not date_str:
-        return None
-    try:
-        # Parse the date string with timezone offset
-        dt = datetime.strptime(date_str, '%Y-%m-%d %H:%M:%S %z')
-        return dt
-    except (ValueError, TypeError):
-        return None
+from orders.importer import (
+    OrderImporter, ChecksumReader, read_csv_chunks, file_checksum, import_in_parallel,
+    DEFAULT_BATCH_SIZE, DEFAULT_CHUNK_SIZE,
+)
+from orders.instrumentation import QueryCounter, StageTimer, ProgressReporter
+from orders.models import ImportRun
+import os
 
 
 class Command(BaseCommand):
     help = 'Import orders from CSV'
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--path',
+            default='orders_export.csv',
+            help="Shopify orders export to import, or '-' to read from stdin",
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=DEFAULT_BATCH_SIZE,
+            help='Number of orders written per bulk insert/update transaction',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=DEFAULT_CHUNK_SIZE,
+            help='Number of CSV rows read into memory at a time',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Number of processes used to parse and normalize CSV chunks (1 = no pool)',
+        )
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Re-check orders placed well before the last import watermark too',
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Import the file even if the ledger shows it was already imported',
+        )
+        parser.add_argument(
+            '--summary-json',
+            help='Write a JSON summary of the run (counters, stage timings, queries) to this file',
+        )
+
     def handle(self, *args, **options):
-        file_path = 'orders_export.csv'
-        if not os.path.exists(file_path):
+        file_path = options['path']
+        checksum = None
+        total_bytes = None
+        if file_path == '-':
+            source = ChecksumReader(sys.stdin.buffer)
+            file_path = '<stdin>'
+        elif os.path.exists(file_path):
+            checksum = file_checksum(file_path)
+            already_imported = ImportRun.objects.filter(checksum=checksum, completed_at__isnull=False)
+            if already_imported.exists() and not options['force']:
+                self.stdout.write(self.style.WARNING(
+                    f'{file_path} was already imported on {already_imported.first().completed_at:%Y-%m-%d %H:%M}, skipping'
+                ))
+                return
+            source = open(file_path, 'rb')
+            total_bytes = os.path.getsize(file_path)
+        else:
             self.stdout.write(self.style.ERROR('CSV file not found'))
             return
 
-        # Read CSV
-        # Note: We need to handle potential string/float issues with Zip codes or Phone numbers if we use them
-        df = pd.read_csv(file_path, dtype=str) 
-        df = df.fillna('')
-
-        for index, row in df.iterrows():
-            order_number = row['Name']
-            
-            if not order_number:
-                continue
+        # Orders well before everything applied by earlier runs are only checked for existence
+        watermark = None if options['full'] else ImportRun.latest_watermark()
+        run = ImportRun.objects.create(source=file_path, checksum=checksum or '')
+        started = time.monotonic()
 
-            # Create or Get Order
-            # We rely on the first occurrence having the shipping details
-            subtotal = 0.00
-            if row['Subtotal']:
-                 try:
-                     subtotal = float(row['Subtotal'])
-                 except:
-                     pass
+        timer = StageTimer()
+        queries = QueryCounter()
+        progress = ProgressReporter(self.stderr, total_bytes) if options['verbosity'] >= 1 else None
+        importer = OrderImporter(batch_size=max(options['batch_size'], 1), watermark=watermark, timer=timer)
 
-            # Parse the original order date from Shopify
-            order_date = parse_shopify_date(row['Created at'])
-            
-            order, created = Order.objects.get_or_create(
-                order_number=order_number,
-                defaults={
-                    'customer_name': row['Shipping Name'],
-                    'shipping_address': f"{row['Shipping Address1']} {row['Shipping Address2']} {row['Shipping City']} {row['Shipping Zip']}".strip(),
-                    'subtotal': subtotal,
-                    'currency': row['Currency'] if row['Currency'] else 'GBP',
-                    'is_fulfilled': row['Fulfillment Status'] == 'fulfilled',
-                    'order_date': order_date
-                }
-            )
-            
-            # If the order was just created and we missed shipping info (unlikely if sorted), 
-            # or if we want to update it just in case:
-            if not created:
-                has_changes = False
-                if not order.customer_name and row['Shipping Name']:
-                     order.customer_name = row['Shipping Name']
-                     order.shipping_address = f"{row['Shipping Address1']} {row['Shipping Address2']} {row['Shipping City']} {row['Shipping Zip']}".strip()
-                     has_changes = True
-                
-                # Update subtotal if it was 0 (or adjust logic as needed)
-                if order.subtotal == 0 and row['Subtotal']:
-                    try:
-                        order.subtotal = float(row['Subtotal'])
-                        has_changes = True
-                    except:
-                        pass
-                
-                # Update order_date if missing
-                if not order.order_date and order_date:
-                    order.order_date = order_date
-                    has_changes = True
-                
-                if has_changes:
-                    order.save()
+        def tracked_chunks():
+            rows_read = 0
+            chunks = read_csv_chunks(source, chunk_size=max(options['chunk_size'], 1))
+            for chunk in timer.iterate('read', chunks):
+                rows_read += len(chunk)
+                if progress:
+                    progress.update(rows_read, source.tell() if total_bytes else None)
+                yield chunk
 
+        with connection.execute_wrapper(queries):
+            if options['workers'] > 1:
+                import_in_parallel(importer, tracked_chunks(), options['workers'])
+            else:
+                for chunk in tracked_chunks():
+                    importer.add_chunk(chunk)
+            importer.flush()
+        if total_bytes is not None:
+            source.close()
 
-            # Create Line Item
-            # Basic check to avoid duplicates if running multiple times? 
-            # Since we don't have unique IDs for line items easily, we might duplicate if we run this command twice.
-            # For this "quick app", let's assume we run it once or clear the DB.
-            # Or we can check if a line item with same product/sku exists for this order.
-            
-            # Let's purge items for the order if created (fresh start for that order) - wait, no, because we loop rows.
-            
-            # Parse quantity
-            quantity = 1
-            if row['Lineitem quantity']:
-                try:
-                    quantity = int(float(row['Lineitem quantity']))
-                except:
-                    pass
-            
-            # Check if this line item already exists for this order
-            existing_item = LineItem.objects.filter(
-                order=order,
-                product_name=row['Lineitem name'],
-                sku=row['Lineitem sku']
-            ).first()
+        stats = importer.stats
+        if progress:
+            progress.finish(stats['rows'])
+        run.checksum = checksum or source.hexdigest()
+        run.row_count = stats['rows']
+        run.duration = time.monotonic() - started
+        run.watermark = importer.max_created_at
+        run.completed_at = timezone.now()
+        run.save()
 
-            if existing_item:
-                # Add to existing quantity (handles multiple CSV rows for same product)
-                existing_item.quantity += quantity
-                existing_item.save()
-            elif row['Lineitem name']:
-                LineItem.objects.create(
-                    order=order,
-                    product_name=row['Lineitem name'],
-                    quantity=quantity,
-                    sku=row['Lineitem sku']
-                )
+        self.stdout.write(self.style.SUCCESS(
+            f"Successfully imported orders "
+            f"({stats['orders_created']} created, {stats['orders_updated']} updated, "
+            f"{stats['items_created']} line items created, {stats['items_merged']} merged, "
+            f"{stats['settled_orders']} settled orders left as they were, "
+            f"{stats['skipped_rows']} rows without an order number skipped)"
+        ))
+        orders_written = stats['orders_created'] + stats['orders_updated']
+        self.stdout.write(
+            f"Processed {stats['rows']} rows in {run.duration:.2f}s "
+            f"({stats['rows'] / max(run.duration, 1e-9):.0f} rows/s, "
+            f"{orders_written / max(run.duration, 1e-9):.0f} orders written/s, "
+            f"{queries.count} queries in {queries.duration:.2f}s)"
+        )
+        if options['verbosity'] >= 2:
+            for name, stage in timer.summary().items():
+                self.stdout.write(f"  {name:<14} {stage['seconds']:>8.3f}s  ({stage['calls']} calls)")
 
-        self.stdout.write(self.style.SUCCESS(f'Successfully imported orders'))
+        if options['summary_json']:
+            summary = {
+                'source': run.source,
+                'checksum': run.checksum,
+                'started_at': run.started_at.isoformat(),
+                'duration': round(run.duration, 4),
+                'watermark': run.watermark.isoformat() if run.watermark else None,
+                'rows_per_second': round(stats['rows'] / max(run.duration, 1e-9), 1),
+                'counters': stats,
+                'stages': timer.summary(),
+                'queries': {'count': queries.count, 'seconds': round(queries.duration, 4)},
+            }
+            with open(options['summary_json'], 'w') as f:
+                json.dump(summary, f, indent=2)
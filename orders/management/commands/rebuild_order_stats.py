@@ -0,0 +1,42 @@
+from decimal import Decimal
+from django.core.management.base import BaseCommand, CommandError
+from orders.models import Order, OrderStats
+
+
+CENT = Decimal('0.01')
+
+
+class Command(BaseCommand):
+    help = 'Recompute the materialized dashboard statistics (OrderStats) from the orders table'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help="Only report whether the stored statistics have drifted from the orders, don't rebuild",
+        )
+
+    def handle(self, *args, **options):
+        if options['check']:
+            stored = {
+                OrderStats.key(row): (row.order_count, row.revenue)
+                for row in OrderStats.objects.exclude(order_count=0, revenue=0)
+            }
+            # SQLite sums the subtotals as floats (e.g. 34968.3800000001), so
+            # round them to the cents the stored revenue holds
+            actual = {
+                tuple(group[field] for field in OrderStats.KEY_FIELDS): (
+                    group['order_count'], OrderStats.amount(group['revenue']).quantize(CENT)
+                )
+                for group in OrderStats.groups(Order.objects.all())
+            }
+            if stored != actual:
+                raise CommandError('Order statistics are out of date; run rebuild_order_stats')
+            self.stdout.write(self.style.SUCCESS('Order statistics are up to date'))
+            return
+
+        OrderStats.rebuild()
+        summary = OrderStats.summary()
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt order statistics: {summary['unpacked_count']} to pack, {summary['packed_count']} packed"
+        ))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand, CommandError
+from orders.models import OrderNumberSequence
+
+
+class Command(BaseCommand):
+    help = 'Reserve a block of manual order numbers, e.g. for a batch of orders entered on paper'
+
+    def add_arguments(self, parser):
+        parser.add_argument('count', type=int, help='How many order numbers to reserve')
+
+    def handle(self, *args, **options):
+        if options['count'] < 1:
+            raise CommandError('count must be at least 1')
+        numbers = OrderNumberSequence.reserve(options['count'])
+        self.stdout.write(self.style.SUCCESS(f"Reserved {len(numbers)} order numbers: {numbers[0]} to {numbers[-1]}"))
+        if options['verbosity'] >= 2:
+            for number in numbers:
+                self.stdout.write(number)
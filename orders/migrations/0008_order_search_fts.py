@@ -0,0 +1,109 @@
+# Generated by Django 6.0.1 on 2026-10-18 09:12
+
+from django.db import migrations
+from django.db.utils import OperationalError
+
+
+FTS_TABLE = 'orders_order_fts'
+
+CREATE_FTS_SQL = [
+    f"""
+    CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(
+        order_number, customer_name, shipping_address, products,
+        tokenize = 'unicode61 remove_diacritics 2'
+    )
+    """,
+    f"""
+    CREATE TRIGGER {FTS_TABLE}_order_insert AFTER INSERT ON orders_order BEGIN
+        INSERT INTO {FTS_TABLE} (rowid, order_number, customer_name, shipping_address, products)
+        VALUES (new.id, new.order_number, new.customer_name, new.shipping_address, '');
+    END
+    """,
+    f"""
+    CREATE TRIGGER {FTS_TABLE}_order_update
+    AFTER UPDATE OF order_number, customer_name, shipping_address ON orders_order BEGIN
+        UPDATE {FTS_TABLE}
+        SET order_number = new.order_number,
+            customer_name = new.customer_name,
+            shipping_address = new.shipping_address
+        WHERE rowid = new.id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER {FTS_TABLE}_order_delete AFTER DELETE ON orders_order BEGIN
+        DELETE FROM {FTS_TABLE} WHERE rowid = old.id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER {FTS_TABLE}_item_insert AFTER INSERT ON orders_lineitem BEGIN
+        UPDATE {FTS_TABLE} SET products = (
+            SELECT group_concat(product_name || ' ' || coalesce(sku, ''), ' ')
+            FROM orders_lineitem WHERE order_id = new.order_id
+        ) WHERE rowid = new.order_id;
+    END
+    """,
+    # Quantity changes (the bulk of re-import updates) don't touch the index
+    f"""
+    CREATE TRIGGER {FTS_TABLE}_item_update
+    AFTER UPDATE OF product_name, sku, order_id ON orders_lineitem BEGIN
+        UPDATE {FTS_TABLE} SET products = coalesce((
+            SELECT group_concat(product_name || ' ' || coalesce(sku, ''), ' ')
+            FROM orders_lineitem WHERE order_id = {FTS_TABLE}.rowid
+        ), '') WHERE rowid IN (old.order_id, new.order_id);
+    END
+    """,
+    f"""
+    CREATE TRIGGER {FTS_TABLE}_item_delete AFTER DELETE ON orders_lineitem BEGIN
+        UPDATE {FTS_TABLE} SET products = coalesce((
+            SELECT group_concat(product_name || ' ' || coalesce(sku, ''), ' ')
+            FROM orders_lineitem WHERE order_id = old.order_id
+        ), '') WHERE rowid = old.order_id;
+    END
+    """,
+]
+
+POPULATE_FTS_SQL = f"""
+    INSERT INTO {FTS_TABLE} (rowid, order_number, customer_name, shipping_address, products)
+    SELECT o.id, o.order_number, o.customer_name, o.shipping_address, coalesce((
+        SELECT group_concat(i.product_name || ' ' || coalesce(i.sku, ''), ' ')
+        FROM orders_lineitem i WHERE i.order_id = o.id
+    ), '')
+    FROM orders_order o
+"""
+
+DROP_FTS_SQL = [
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_{name}'
+    for name in ('order_insert', 'order_update', 'order_delete', 'item_insert', 'item_update', 'item_delete')
+] + [f'DROP TABLE IF EXISTS {FTS_TABLE}']
+
+
+def create_search_index(apps, schema_editor):
+    # FTS5 is SQLite only; other databases keep using the icontains fallback
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    try:
+        schema_editor.execute(CREATE_FTS_SQL[0])
+    except OperationalError:
+        # SQLite built without FTS5
+        return
+    for sql in CREATE_FTS_SQL[1:]:
+        schema_editor.execute(sql)
+    schema_editor.execute(POPULATE_FTS_SQL)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for sql in DROP_FTS_SQL:
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0007_importrun'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 6.0.1 on 2026-10-18 11:20
+
+from django.db import migrations, models
+
+
+def create_orders_version(apps, schema_editor):
+    DataVersion = apps.get_model('orders', 'DataVersion')
+    DataVersion.objects.get_or_create(key='orders')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0009_order_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DataVersion',
+            fields=[
+                ('key', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('version', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(create_orders_version, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 6.0.1 on 2026-10-18 12:40
+
+from importlib import import_module
+
+from django.db import migrations, models
+
+
+# Adding a non-null column makes SQLite rebuild orders_order, which drops the
+# triggers keeping the search index in sync: recreate the index from 0008.
+search_index = import_module('orders.migrations.0008_order_search_fts')
+
+
+def restore_search_index(apps, schema_editor):
+    search_index.drop_search_index(apps, schema_editor)
+    search_index.create_search_index(apps, schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0010_dataversion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='version',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['version'], name='order_version_idx'),
+        ),
+        migrations.RunPython(restore_search_index, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 6.0.1 on 2026-10-18 14:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0011_order_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderNumberSequence',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('prefix', models.CharField(blank=True, max_length=20)),
+                ('suffix', models.CharField(blank=True, max_length=20)),
+                ('last_value', models.BigIntegerField(default=0)),
+            ],
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 6.0.1 on 2026-10-18 14:40
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def build_order_stats(apps, schema_editor):
+    # Same as OrderStats.rebuild(), against the historical models
+    Order = apps.get_model('orders', 'Order')
+    OrderStats = apps.get_model('orders', 'OrderStats')
+    groups = (
+        Order.objects.order_by()
+        .values('is_packed', 'is_verified', 'is_fulfilled', 'currency')
+        .annotate(order_count=Count('id'), revenue=Sum('subtotal'))
+    )
+    OrderStats.objects.bulk_create(OrderStats(**group) for group in groups)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0012_ordernumbersequence'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('is_packed', models.BooleanField()),
+                ('is_verified', models.BooleanField()),
+                ('is_fulfilled', models.BooleanField()),
+                ('currency', models.CharField(max_length=10)),
+                ('order_count', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('is_packed', 'is_verified', 'is_fulfilled', 'currency'), name='order_stats_key')],
+            },
+        ),
+        migrations.RunPython(build_order_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,81 @@
+# Generated by Django 6.0.1 on 2026-10-18 16:05
+
+from importlib import import_module
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+# Making the column required makes SQLite rebuild orders_lineitem, which drops
+# the triggers keeping the search index in sync: recreate the index from 0008.
+search_index = import_module('orders.migrations.0008_order_search_fts')
+
+
+def build_catalog(apps, schema_editor):
+    """
+    Add a product for every SKU and every SKU-less name already sold, point
+    the line items at them, and carry over the classification reports used
+    to get from name matching.
+    """
+    Product = apps.get_model('orders', 'Product')
+    LineItem = apps.get_model('orders', 'LineItem')
+
+    def classification(name):
+        return {
+            'title': name.split(' - ')[0].strip(),
+            'is_preorder': 'pre-order' in name.lower(),
+            # What analytics and royalties matched with icontains until now
+            'royalty_bearing': 'through bear' in name.lower(),
+        }
+
+    sold = LineItem.objects.order_by('product_name', 'sku').values_list('product_name', 'sku').distinct()
+    by_sku = {}
+    by_name = {}
+    for name, sku in sold:
+        if sku and sku not in by_sku:
+            by_sku[sku] = Product.objects.create(sku=sku, name=name, **classification(name))
+        elif not sku and name not in by_name:
+            by_name[name] = Product.objects.create(name=name, **classification(name))
+
+    for sku, product in by_sku.items():
+        LineItem.objects.filter(sku=sku).update(product=product)
+    for name, product in by_name.items():
+        LineItem.objects.filter(product_name=name, product__isnull=True).update(product=product)
+
+
+def restore_search_index(apps, schema_editor):
+    search_index.drop_search_index(apps, schema_editor)
+    search_index.create_search_index(apps, schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0013_orderstats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Product',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sku', models.CharField(blank=True, max_length=100, null=True, unique=True)),
+                ('name', models.CharField(db_index=True, max_length=255)),
+                ('title', models.CharField(max_length=255)),
+                ('is_preorder', models.BooleanField(default=False)),
+                ('royalty_bearing', models.BooleanField(default=False)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='lineitem',
+            name='product',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='line_items', to='orders.product'),
+        ),
+        migrations.RunPython(build_catalog, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='lineitem',
+            name='product',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='line_items', to='orders.product'),
+        ),
+        migrations.RunPython(restore_search_index, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 6.0.1 on 2026-10-18 18:05
+
+from django.db import migrations
+
+
+# Product.ROYALTY_TITLE, the title royalties are paid on
+BOOK_TITLE = "Through Bear's Eyes"
+
+
+def seed_royalty_book(apps, schema_editor):
+    """
+    0014 only flagged the book where it had already been sold, so a fresh
+    install (or one that imported after migrating) counted no royalties.
+    Add the book to the catalog and flag every variant of it.
+    """
+    Product = apps.get_model('orders', 'Product')
+    if not Product.objects.filter(title__iexact=BOOK_TITLE).exists():
+        Product.objects.create(name=BOOK_TITLE, title=BOOK_TITLE, royalty_bearing=True)
+    Product.objects.filter(title__iexact=BOOK_TITLE).update(royalty_bearing=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0014_product'),
+    ]
+
+    operations = [
+        migrations.RunPython(seed_royalty_book, migrations.RunPython.noop),
+    ]
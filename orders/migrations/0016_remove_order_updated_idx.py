@@ -0,0 +1,17 @@
+# Generated by Django 6.0.1 on 2026-10-18 18:20
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0015_seed_royalty_book'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='order',
+            name='order_updated_idx',
+        ),
+    ]
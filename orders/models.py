@@ -1,4 +1,91 @@
-from django.db import models
+import re
+from decimal import Decimal
+from django.db import models, transaction
+from django.db.models import Case, Count, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from .events import broadcaster
+from .pagination import SORT_KEYS
+from . import search as order_search
+
+
+class OrderQuerySet(models.QuerySet):
+    """Reusable filters for order pages, so each page runs a fixed number of queries."""
+
+    def unpacked(self):
+        return self.filter(is_packed=False)
+
+    def packed(self):
+        return self.filter(is_packed=True)
+
+    def for_display(self):
+        """Prefetch line items and annotate their count."""
+        # A correlated subquery rather than a JOIN + GROUP BY, so the page can
+        # still be read in index order and stop after LIMIT rows
+        items = LineItem.objects.filter(order=OuterRef('pk')).order_by().values('order')
+        return self.prefetch_related('items').annotate(
+            # An order without items has no group, so the subquery returns NULL
+            item_count=Coalesce(Subquery(items.annotate(count=Count('id')).values('count')), 0),
+        )
+
+    def search(self, query):
+        """
+        Orders matching every word of `query` as a prefix of their number,
+        customer, address or line items, via the FTS5 index. Falls back to
+        substring matching where the index isn't available.
+        """
+        if not query:
+            return self
+        expression = order_search.match_expression(query)
+        if expression and order_search.fts_available(self.db):
+            return self.filter(id__in=order_search.matching_order_ids(expression))
+        return self.filter(
+            Q(order_number__icontains=query) |
+            Q(customer_name__icontains=query) |
+            Q(shipping_address__icontains=query)
+        )
+
+    def sorted_by(self, sort_option):
+        field, descending = SORT_KEYS.get(sort_option, SORT_KEYS['oldest'])
+        if descending:
+            return self.order_by('-' + field, '-id')
+        return self.order_by(field, 'id')
+
+    def update_tracked(self, flip=None, **fields):
+        """
+        update() that also bumps updated_at and the orders DataVersion, keeps
+        OrderStats in step and notifies open pages, as saving each order would
+        through its signals. `flip` names a boolean field to negate in the
+        database. Returns the number of orders updated.
+        """
+        if flip:
+            fields[flip] = Case(When(**{flip: True}, then=Value(False)), default=Value(True))
+        with transaction.atomic():
+            # Bump (a write) first, so on SQLite the transaction holds the write lock
+            # before reading which stats groups the orders are about to leave
+            version = DataVersion.bump()
+            moving = OrderStats.groups(self) if OrderStats.affected_by(fields) else []
+            count = self.update(updated_at=timezone.now(), version=version, **fields)
+            if count:
+                OrderStats.move(moving, fields, flip)
+                transaction.on_commit(lambda: broadcaster.publish({'version': version}))
+            else:
+                # Nothing changed (a retried request or a missing id): undo the bump, so
+                # cached pages stay valid and open pages have nothing to fetch
+                transaction.set_rollback(True)
+        return count
+
+    def set_flag(self, field, value=None):
+        """
+        Set boolean `field` to `value` in a single conditional UPDATE, only on
+        orders not already in that state, so retried requests are no-ops. With
+        no `value`, each order's flag is flipped in the database instead.
+        Returns the number of orders changed.
+        """
+        if value is None:
+            return self.update_tracked(flip=field)
+        return self.exclude(**{field: value}).update_tracked(**{field: value})
+
 
 class Order(models.Model):
     order_number = models.CharField(max_length=50, unique=True)
@@ -12,15 +99,356 @@ class Order(models.Model):
     order_date = models.DateTimeField(null=True, blank=True)  # Original order date from Shopify
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    version = models.BigIntegerField(default=0)  # DataVersion of the order's last change
+
+    objects = OrderQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Packing lists filter on is_packed and page through created_at or subtotal.
+            # Partial indexes, because SQLite can't use an (is_packed, ...) index for
+            # the bare `NOT "is_packed"` / `"is_packed"` terms Django generates.
+            models.Index(fields=['created_at'], condition=Q(is_packed=False), name='order_unpacked_created_idx'),
+            models.Index(fields=['subtotal'], condition=Q(is_packed=False), name='order_unpacked_subtotal_idx'),
+            models.Index(fields=['created_at'], condition=Q(is_packed=True), name='order_packed_created_idx'),
+            models.Index(fields=['subtotal'], condition=Q(is_packed=True), name='order_packed_subtotal_idx'),
+            # Analytics and royalty periods select by Shopify order date
+            models.Index(fields=['order_date'], name='order_date_idx'),
+            # The changes API fetches orders changed since a client's version
+            models.Index(fields=['version'], name='order_version_idx'),
+        ]
 
     def __str__(self):
         return self.order_number
 
+    def save(self, *args, **kwargs):
+        # One transaction around the signals too: pre_save reads the old row for
+        # the stats and post_save applies the delta, with nothing in between
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+
+
+class OrderStats(models.Model):
+    """
+    Materialized order counts and revenue, one row per combination of packing,
+    verification and fulfilment state and currency, so the dashboard reads a
+    handful of rows instead of aggregating the orders table.
+
+    Kept up to date incrementally by the Order signals, OrderQuerySet.update_tracked()
+    and the importer; `manage.py rebuild_order_stats` recomputes it from scratch.
+    """
+    is_packed = models.BooleanField()
+    is_verified = models.BooleanField()
+    is_fulfilled = models.BooleanField()
+    currency = models.CharField(max_length=10)
+    order_count = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    KEY_FIELDS = ('is_packed', 'is_verified', 'is_fulfilled', 'currency')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['is_packed', 'is_verified', 'is_fulfilled', 'currency'], name='order_stats_key'),
+        ]
+
+    def __str__(self):
+        return f"{self.currency} packed={self.is_packed} verified={self.is_verified}: {self.order_count}"
+
+    @classmethod
+    def key(cls, order):
+        return tuple(getattr(order, field) for field in cls.KEY_FIELDS)
+
+    @staticmethod
+    def amount(value):
+        # Unsaved orders can still hold the float field default
+        return Decimal(str(value or 0))
+
+    @classmethod
+    def add(cls, deltas, key, count, revenue):
+        """Accumulate a (count, revenue) change for `key` into `deltas`."""
+        total_count, total_revenue = deltas.get(key, (0, Decimal(0)))
+        deltas[key] = (total_count + count, total_revenue + cls.amount(revenue))
+
+    @classmethod
+    def apply(cls, deltas):
+        """Apply {key: (count, revenue)} changes, one UPDATE (or INSERT) per key."""
+        for key, (count, revenue) in deltas.items():
+            if not count and not revenue:
+                continue
+            lookup = dict(zip(cls.KEY_FIELDS, key))
+            updated = cls.objects.filter(**lookup).update(
+                order_count=models.F('order_count') + count,
+                revenue=models.F('revenue') + revenue,
+            )
+            if not updated:
+                cls.objects.create(order_count=count, revenue=revenue, **lookup)
+
+    @classmethod
+    def groups(cls, orders):
+        """The stats groups covered by the `orders` queryset, with their counts and revenue."""
+        return list(
+            orders.order_by().values(*cls.KEY_FIELDS).annotate(order_count=Count('id'), revenue=Sum('subtotal'))
+        )
+
+    @classmethod
+    def affected_by(cls, fields):
+        return any(field in fields for field in cls.KEY_FIELDS)
+
+    @classmethod
+    def move(cls, groups, fields, flip=None):
+        """Move `groups` (from groups()) to the state an UPDATE setting `fields` left them in."""
+        deltas = {}
+        for group in groups:
+            old_key = tuple(group[field] for field in cls.KEY_FIELDS)
+            new_state = dict(group)
+            for field in cls.KEY_FIELDS:
+                if field == flip:
+                    new_state[field] = not group[field]
+                elif field in fields:
+                    new_state[field] = fields[field]
+            new_key = tuple(new_state[field] for field in cls.KEY_FIELDS)
+            if new_key != old_key:
+                cls.add(deltas, old_key, -group['order_count'], -cls.amount(group['revenue']))
+                cls.add(deltas, new_key, group['order_count'], group['revenue'])
+        cls.apply(deltas)
+
+    @classmethod
+    def rebuild(cls):
+        """Recompute every row from the orders table."""
+        with transaction.atomic():
+            cls.objects.all().delete()
+            cls.objects.bulk_create(cls(**group) for group in cls.groups(Order.objects.all()))
+
+    @classmethod
+    def summary(cls):
+        """Dashboard totals, from at most a few dozen rows."""
+        totals = {
+            'packed_count': 0, 'unpacked_count': 0, 'verified_count': 0, 'fulfilled_count': 0,
+            'total_revenue': Decimal(0), 'revenue_by_currency': {},
+        }
+        for row in cls.objects.filter(order_count__gt=0):
+            totals['packed_count' if row.is_packed else 'unpacked_count'] += row.order_count
+            totals['verified_count'] += row.order_count if row.is_verified else 0
+            totals['fulfilled_count'] += row.order_count if row.is_fulfilled else 0
+            totals['total_revenue'] += row.revenue
+            by_currency = totals['revenue_by_currency']
+            by_currency[row.currency] = by_currency.get(row.currency, Decimal(0)) + row.revenue
+        return totals
+
+
+class Product(models.Model):
+    """
+    Catalog entry for something sold, so reports select line items by
+    product id instead of matching product names.
+
+    Line items are resolved to a product once, when imported or entered:
+    by SKU, which survives Shopify renaming a variant, else by name. Products
+    seen for the first time are added with a classification guessed from
+    their name (see classify()), which can be corrected in the admin.
+    """
+    sku = models.CharField(max_length=100, unique=True, null=True, blank=True)
+    name = models.CharField(max_length=255, db_index=True)  # As last sold
+    title = models.CharField(max_length=255)  # Shared by a product's variants
+    is_preorder = models.BooleanField(default=False)
+    royalty_bearing = models.BooleanField(default=False)  # Counted in royalty payments and book analytics
+
+    PREORDER_MARKER = 'pre-order'
+    VARIANT_SEPARATOR = ' - '
+    # The book royalties are paid on (see payments.PaymentPeriod)
+    ROYALTY_TITLE = "Through Bear's Eyes"
+
+    def __str__(self):
+        return self.name
+
+    @classmethod
+    def classify(cls, name):
+        """
+        Classification for a new product sold as `name`, e.g. "Through Bear's
+        Eyes - Signed Pre-Order": title before the variant, pre-order from
+        the name, and royalties if the title is the royalty book
+        (ROYALTY_TITLE) or another variant of the title bears them.
+        """
+        title = name.split(cls.VARIANT_SEPARATOR)[0].strip()
+        return {
+            'title': title,
+            'is_preorder': cls.PREORDER_MARKER in name.lower(),
+            'royalty_bearing': (
+                title.lower() == cls.ROYALTY_TITLE.lower()
+                or cls.objects.filter(title=title, royalty_bearing=True).exists()
+            ),
+        }
+
+    @classmethod
+    def resolve(cls, name, sku=None):
+        """The product sold as `name` and `sku`, added to the catalog if new."""
+        sku = sku or None
+        if sku:
+            product = cls.objects.filter(sku=sku).first()
+        else:
+            product = cls.objects.filter(name=name).order_by('id').first()
+        if product is None:
+            product = cls.objects.create(sku=sku, name=name, **cls.classify(name))
+        return product
+
+    @classmethod
+    def resolve_many(cls, keys):
+        """resolve() for many (name, sku) pairs, returned as {(name, sku): Product}."""
+        skus = {sku for _, sku in keys if sku}
+        names = {name for name, sku in keys if not sku}
+        by_sku = cls.objects.in_bulk(skus, field_name='sku') if skus else {}
+        by_name = {}
+        for product in cls.objects.filter(name__in=names).order_by('-id'):
+            by_name[product.name] = product  # The oldest product of a name wins, as in resolve()
+
+        resolved = {}
+        for name, sku in keys:
+            known = by_sku if sku else by_name
+            if (sku or name) not in known:
+                known[sku or name] = cls.resolve(name, sku)
+            resolved[(name, sku)] = known[sku or name]
+        return resolved
+
+
 class LineItem(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='items')
-    product_name = models.CharField(max_length=255)
+    product = models.ForeignKey(Product, on_delete=models.PROTECT, related_name='line_items')
+    product_name = models.CharField(max_length=255)  # As sold, even if the product was renamed since
     quantity = models.IntegerField()
     sku = models.CharField(max_length=100, blank=True, null=True)
 
     def __str__(self):
         return f"{self.quantity} x {self.product_name}"
+
+
+class DataVersion(models.Model):
+    """
+    Monotonic counter bumped on every change to a dataset (e.g. 'orders'), so
+    clients can check for updates with one primary key lookup.
+    """
+    ORDERS = 'orders'
+    # Version of the last order deletion; clients older than it must reload
+    ORDERS_RESET = 'orders_reset'
+    PAYMENTS = 'payments'
+
+    key = models.CharField(max_length=50, primary_key=True)
+    version = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.key} v{self.version}"
+
+    @classmethod
+    def current(cls, key=ORDERS):
+        return cls.objects.filter(key=key).values_list('version', flat=True).first() or 0
+
+    @classmethod
+    def set(cls, key, version):
+        cls.objects.update_or_create(key=key, defaults={'version': version})
+
+    @classmethod
+    def bump(cls, key=ORDERS):
+        """Increment the counter and return the new version."""
+        with transaction.atomic():
+            if not cls.objects.filter(key=key).update(version=models.F('version') + 1):
+                cls.objects.create(key=key, version=1)
+            return cls.current(key)
+
+
+class OrderNumberSequence(models.Model):
+    """
+    Counter handing out manual order numbers (e.g. '#1042') in atomic blocks,
+    so concurrent add_order submissions never compute the same number.
+    """
+    name = models.CharField(max_length=50, primary_key=True)
+    prefix = models.CharField(max_length=20, blank=True)
+    suffix = models.CharField(max_length=20, blank=True)
+    last_value = models.BigIntegerField(default=0)
+
+    DEFAULT = 'orders'
+
+    def __str__(self):
+        return f"{self.prefix}{self.last_value}{self.suffix}"
+
+    def format(self, number):
+        return f"{self.prefix}{number}{self.suffix}"
+
+    @staticmethod
+    def highest_in_use(prefix, suffix):
+        """Highest number used by an order numbered `<prefix><number><suffix>`."""
+        pattern = re.compile(rf'{re.escape(prefix)}(\d+){re.escape(suffix)}')
+        numbers = Order.objects.filter(
+            order_number__startswith=prefix, order_number__endswith=suffix
+        ).values_list('order_number', flat=True).iterator()
+        return max((int(m.group(1)) for m in map(pattern.fullmatch, numbers) if m), default=0)
+
+    @classmethod
+    def seed_values(cls):
+        """
+        Prefix, suffix and highest number in use, following the format of the
+        latest order, or '#' and 1000 when there are no orders yet.
+        """
+        last_order = Order.objects.order_by('-created_at').only('order_number').first()
+        if not last_order:
+            return '#', '', 1000
+        match = re.search(r'\d+', last_order.order_number)
+        if not match:
+            # No number to continue from, so number on from it: 'ABC' -> 'ABC-1'
+            prefix, suffix = f"{last_order.order_number}-", ''
+        else:
+            prefix = last_order.order_number[:match.start()]
+            suffix = last_order.order_number[match.end():]
+        return prefix, suffix, cls.highest_in_use(prefix, suffix)
+
+    @classmethod
+    def reserve(cls, count=1, name=DEFAULT):
+        """
+        Atomically reserve the next `count` order numbers and return them. The
+        sequence is seeded from the existing orders on first use, and re-seeded
+        if imported orders have since taken numbers it was about to hand out.
+        """
+        with transaction.atomic():
+            # Write first: on SQLite a transaction that reads before writing can't
+            # wait for the write lock, so concurrent callers would fail as locked
+            incremented = cls.objects.filter(name=name).update(last_value=models.F('last_value') + count)
+            if not incremented:
+                prefix, suffix, highest = cls.seed_values()
+                _, created = cls.objects.get_or_create(name=name, defaults={
+                    'prefix': prefix, 'suffix': suffix, 'last_value': highest + count,
+                })
+                if not created:
+                    cls.objects.filter(name=name).update(last_value=models.F('last_value') + count)
+            sequence = cls.objects.get(name=name)
+            numbers = [sequence.format(n) for n in range(sequence.last_value - count + 1, sequence.last_value + 1)]
+            if Order.objects.filter(order_number__in=numbers).exists():
+                highest = cls.highest_in_use(sequence.prefix, sequence.suffix)
+                sequence.last_value = max(highest, sequence.last_value) + count
+                sequence.save(update_fields=['last_value'])
+                numbers = [sequence.format(n) for n in range(sequence.last_value - count + 1, sequence.last_value + 1)]
+        return numbers
+
+    @classmethod
+    def next_number(cls, name=DEFAULT):
+        return cls.reserve(1, name)[0]
+
+
+class ImportRun(models.Model):
+    """Ledger entry for one run of the import_orders command."""
+    source = models.CharField(max_length=255)
+    checksum = models.CharField(max_length=64, db_index=True)  # SHA-256 of the export file
+    row_count = models.IntegerField(default=0)
+    duration = models.FloatField(default=0)  # Seconds taken by the import
+    watermark = models.DateTimeField(null=True, blank=True)  # Highest Shopify 'Created at' seen
+    started_at = models.DateTimeField(auto_now_add=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-started_at']
+
+    def __str__(self):
+        return f"{self.source} ({self.started_at:%Y-%m-%d %H:%M})"
+
+    @classmethod
+    def latest_watermark(cls):
+        """Highest 'Created at' applied by any completed import run."""
+        return cls.objects.filter(completed_at__isnull=False).aggregate(
+            models.Max('watermark')
+        )['watermark__max']
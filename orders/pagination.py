@@ -0,0 +1,92 @@
+from django.db.models import Q
+
+
+# sort option -> (field, descending). `id` breaks ties in the same direction.
+SORT_KEYS = {
+    'oldest': ('created_at', False),
+    'newest': ('created_at', True),
+    'value_high': ('subtotal', True),
+    'value_low': ('subtotal', False),
+}
+
+
+class KeysetPage:
+    """One page of a keyset-paginated queryset, with cursors for its neighbours."""
+
+    def __init__(self, object_list, has_next, has_previous):
+        self.object_list = object_list
+        self.has_next = has_next
+        self.has_previous = has_previous
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    @property
+    def next_cursor(self):
+        return self.object_list[-1].id if self.has_next else None
+
+    @property
+    def previous_cursor(self):
+        return self.object_list[0].id if self.has_previous else None
+
+
+def _parse_cursor(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _beyond(field, value, pk, descending, inclusive=False):
+    """
+    Q matching rows that sort after (field, id) = (value, pk), or at it if
+    `inclusive`. Written as `field >= value AND (field > value OR id > pk)`
+    so the outer term can be served as an index range.
+    """
+    op = 'lt' if descending else 'gt'
+    pk_op = op + 'e' if inclusive else op
+    return Q(**{f'{field}__{op}e': value}) & (Q(**{f'{field}__{op}': value}) | Q(**{f'id__{pk_op}': pk}))
+
+
+def keyset_page(queryset, sort_option, per_page, after=None, before=None):
+    """
+    Return a KeysetPage of `queryset` ordered by `sort_option`.
+
+    Pages are addressed by cursors (the id of the last order on the previous
+    page via `after`, or the first order on the next page via `before`)
+    instead of page numbers, so each page is a single indexed range scan with
+    no COUNT and no OFFSET, however deep the packer has paged.
+    """
+    field, descending = SORT_KEYS.get(sort_option, SORT_KEYS['oldest'])
+    forward = ['-' + field, '-id'] if descending else [field, 'id']
+    backward = [field, 'id'] if descending else ['-' + field, '-id']
+
+    after, before = _parse_cursor(after), _parse_cursor(before)
+    # The anchor is looked up without the page filters so a cursor stays
+    # valid after its order has been packed or no longer matches the search.
+    anchor_id = after or before
+    anchor = None
+    if anchor_id:
+        anchor = queryset.model.objects.filter(id=anchor_id).values(field, 'id').first()
+
+    if anchor is None:
+        object_list = list(queryset.order_by(*forward)[:per_page + 1])
+        has_next = len(object_list) > per_page
+        return KeysetPage(object_list[:per_page], has_next, False)
+
+    value, pk = anchor[field], anchor['id']
+    if after:
+        object_list = list(queryset.filter(_beyond(field, value, pk, descending)).order_by(*forward)[:per_page + 1])
+        has_next = len(object_list) > per_page
+        object_list = object_list[:per_page]
+        has_previous = queryset.filter(_beyond(field, value, pk, not descending, inclusive=True)).exists()
+    else:
+        object_list = list(queryset.filter(_beyond(field, value, pk, not descending)).order_by(*backward)[:per_page + 1])
+        has_previous = len(object_list) > per_page
+        object_list = object_list[:per_page][::-1]
+        has_next = queryset.filter(_beyond(field, value, pk, descending, inclusive=True)).exists()
+
+    return KeysetPage(object_list, has_next, has_previous)
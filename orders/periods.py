@@ -0,0 +1,73 @@
+"""
+Calendar periods in shop time.
+
+The shop, its reports and the royalty periods run on UK time, while order
+dates are stored in UTC. These helpers turn local days and buckets into
+half-open [start, end) ranges of aware datetimes, so queries compare the
+indexed order_date column directly instead of casting it to a date, and a day
+or month starts at local midnight on either side of a BST change.
+"""
+from datetime import UTC, datetime, time, timedelta
+from zoneinfo import ZoneInfo
+
+from django.utils import timezone
+
+
+SHOP_TIMEZONE = ZoneInfo('Europe/London')
+
+BUCKETS = ('hour', 'day', 'week', 'month')
+
+
+def shop_date(value):
+    """The shop's calendar date at the aware datetime `value` (None stays None)."""
+    return timezone.localdate(value, SHOP_TIMEZONE) if value else None
+
+
+def shop_today():
+    return shop_date(timezone.now())
+
+
+def day_start(day):
+    """The aware datetime of local midnight starting `day`."""
+    return timezone.make_aware(datetime.combine(day, time.min), SHOP_TIMEZONE)
+
+
+def day_range(first, last):
+    """[start, end) covering the local days `first` to `last`, both included."""
+    return day_start(first), day_start(last + timedelta(days=1))
+
+
+def bucket_edges(start, end, bucket):
+    """
+    Local boundaries of the `bucket`s covering [start, end): the first is
+    `start` floored to its hour, day, Monday or first of the month, the last
+    is at or after `end`.
+    """
+    if bucket not in BUCKETS:
+        raise ValueError(f'bucket must be one of {", ".join(BUCKETS)}')
+    if bucket == 'hour':
+        # Hours are steps of real time, so the clock change hour is neither
+        # skipped in spring nor counted twice in autumn (UK offsets are whole hours)
+        edges = [start.astimezone(UTC).replace(minute=0, second=0, microsecond=0)]
+        while edges[-1] < end:
+            edges.append(edges[-1] + timedelta(hours=1))
+        return [edge.astimezone(SHOP_TIMEZONE) for edge in edges]
+
+    edge = timezone.localtime(start, SHOP_TIMEZONE).replace(hour=0, minute=0, second=0, microsecond=0, tzinfo=None)
+    if bucket == 'week':
+        edge -= timedelta(days=edge.weekday())
+    elif bucket == 'month':
+        edge = edge.replace(day=1)
+
+    edges = []
+    while True:
+        # Stepped in wall time, so days and months start at local midnight
+        edges.append(timezone.make_aware(edge, SHOP_TIMEZONE))
+        if edges[-1] >= end:
+            return edges
+        if bucket == 'day':
+            edge += timedelta(days=1)
+        elif bucket == 'week':
+            edge += timedelta(weeks=1)
+        else:
+            edge = edge.replace(year=edge.year + edge.month // 12, month=edge.month % 12 + 1)
@@ -0,0 +1,206 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from .models import DataVersion, LineItem, Order, Product
+from .periods import bucket_edges
+
+
+# Timestamp of line items whose order has no order_date: sorts before every real
+# date, so only ranges without a start (all time) include them
+UNDATED = np.iinfo(np.int64).min
+
+
+def epoch(value):
+    """Seconds since the epoch of an aware datetime, as stored in the timestamp column."""
+    return int(value.timestamp())
+
+
+class SalesColumns:
+    """One immutable snapshot of the line item columns, sorted by timestamp."""
+
+    def __init__(self, version, timestamp, quantity, product_id, order_id, is_preorder):
+        self.version = version  # DataVersion.ORDERS the snapshot was loaded at
+        self.timestamp = timestamp
+        self.quantity = quantity
+        self.product_id = product_id
+        self.order_id = order_id
+        self.is_preorder = is_preorder
+
+    def __len__(self):
+        return len(self.timestamp)
+
+
+class SalesEngine:
+    """
+    In-process columnar copy of line item sales, answering analytics for any
+    date range, product selection and bucket size without touching the
+    database.
+
+    Each line item is a row of sorted NumPy arrays: order timestamp (epoch
+    seconds), quantity, product id, order id and the product's pre-order flag.
+    A range is located with searchsorted and bucketed with np.add.reduceat.
+
+    The arrays are loaded on first use and refreshed from the orders
+    DataVersion: rows of orders changed since the loaded version are replaced,
+    and a deletion (ORDERS_RESET) reloads everything. Product flags are re-read
+    on every refresh, because reclassifying a product doesn't touch its orders.
+
+    query() results are kept in a bounded LRU keyed by their arguments and the
+    version, so dashboards repeating the same ranges don't recompute them.
+    """
+    QUERY_CACHE_SIZE = 256
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.columns = None
+        self.products = {}  # id -> Product, as of the last refresh
+        self._queries = OrderedDict()  # (version, arguments) -> result, oldest first
+        self._queries_lock = threading.Lock()
+
+    @property
+    def version(self):
+        return self.columns.version if self.columns is not None else None
+
+    def refresh(self):
+        """Bring the columns up to the current orders version. Returns self."""
+        versions = dict(
+            DataVersion.objects.filter(key__in=[DataVersion.ORDERS, DataVersion.ORDERS_RESET])
+            .values_list('key', 'version')
+        )
+        version = versions.get(DataVersion.ORDERS, 0)
+        if version == self.version:
+            return self
+        with self._lock:
+            if version == self.version:
+                return self
+            self.products = Product.objects.in_bulk()
+            if self.columns is None or versions.get(DataVersion.ORDERS_RESET, 0) > self.version:
+                columns = self._load(version, LineItem.objects.all())
+            else:
+                columns = self._merge(version, self.columns)
+            # Swapped in whole, so readers never see a half-updated snapshot
+            self.columns = columns
+        return self
+
+    def _rows(self, items):
+        rows = list(items.order_by().values_list('order__order_date', 'quantity', 'product_id', 'order_id'))
+        timestamp = np.array([epoch(row[0]) if row[0] else UNDATED for row in rows], dtype=np.int64)
+        quantity = np.array([row[1] for row in rows], dtype=np.int64)
+        product_id = np.array([row[2] for row in rows], dtype=np.int64)
+        order_id = np.array([row[3] for row in rows], dtype=np.int64)
+        return timestamp, quantity, product_id, order_id
+
+    def _build(self, version, timestamp, quantity, product_id, order_id):
+        order = np.argsort(timestamp, kind='stable')
+        product_id = product_id[order]
+        preorder_ids = [pk for pk, product in self.products.items() if product.is_preorder]
+        return SalesColumns(
+            version, timestamp[order], quantity[order], product_id, order_id[order],
+            np.isin(product_id, preorder_ids),
+        )
+
+    def _load(self, version, items):
+        return self._build(version, *self._rows(items))
+
+    def _merge(self, version, columns):
+        """`columns` with the rows of orders changed since they were loaded reloaded."""
+        changed = list(Order.objects.filter(version__gt=columns.version).values_list('id', flat=True))
+        keep = ~np.isin(columns.order_id, changed)
+        fresh = self._rows(LineItem.objects.filter(order_id__in=changed))
+        return self._build(version, *(
+            np.concatenate([old[keep], new])
+            for old, new in zip(
+                (columns.timestamp, columns.quantity, columns.product_id, columns.order_id), fresh
+            )
+        ))
+
+    def product_ids(self, titles=None, **flags):
+        """
+        Ids of the products matching `flags` (e.g. royalty_bearing=True) and,
+        if given, one of `titles`, which covers every variant of a title.
+        """
+        return [
+            pk for pk, product in self.products.items()
+            if (titles is None or product.title in titles)
+            and all(getattr(product, name) == value for name, value in flags.items())
+        ]
+
+    def totals(self, start=None, end=None, product_ids=None, preorder=None):
+        """
+        Quantity sold and distinct orders in [start, end) (either open), for
+        `product_ids` (all if None) and pre-order or other variants only if
+        `preorder` is given. Undated orders only count without a start.
+        """
+        return self._totals(self.columns, start, end, product_ids, preorder)
+
+    def series(self, start, end, bucket, product_ids=None, preorder=None):
+        """
+        [(bucket start, quantity)] for each `bucket` (hour/day/week/month)
+        covering [start, end). The first bucket only counts from `start`.
+        """
+        return self._series(self.columns, start, end, bucket, product_ids, preorder)
+
+    def query(self, start=None, end=None, bucket=None, product_ids=None, preorder=None):
+        """
+        totals() of the range plus, with a `bucket`, its series() under
+        'series'. Results are cached per orders version; treat them as read-only.
+        """
+        columns = self.columns
+        key = (
+            columns.version, start, end, bucket,
+            tuple(sorted(product_ids)) if product_ids is not None else None, preorder,
+        )
+        with self._queries_lock:
+            if key in self._queries:
+                self._queries.move_to_end(key)
+                return self._queries[key]
+
+        result = self._totals(columns, start, end, product_ids, preorder)
+        if bucket:
+            result['series'] = self._series(columns, start, end, bucket, product_ids, preorder)
+
+        with self._queries_lock:
+            self._queries[key] = result
+            # Entries of older versions are never hit again and age out first
+            while len(self._queries) > self.QUERY_CACHE_SIZE:
+                self._queries.popitem(last=False)
+        return result
+
+    @staticmethod
+    def _select(columns, start, end, product_ids, preorder):
+        """(first, last) row range of [start, end) and the mask of matching rows in it."""
+        first = np.searchsorted(columns.timestamp, epoch(start)) if start else 0
+        last = np.searchsorted(columns.timestamp, epoch(end)) if end else len(columns)
+        mask = np.ones(last - first, dtype=bool)
+        if product_ids is not None:
+            mask &= np.isin(columns.product_id[first:last], product_ids)
+        if preorder is not None:
+            mask &= columns.is_preorder[first:last] == preorder
+        return first, last, mask
+
+    def _totals(self, columns, start, end, product_ids, preorder):
+        first, last, mask = self._select(columns, start, end, product_ids, preorder)
+        quantity = columns.quantity[first:last][mask]
+        orders = columns.order_id[first:last][mask]
+        return {'quantity': int(quantity.sum()), 'orders': len(np.unique(orders))}
+
+    def _series(self, columns, start, end, bucket, product_ids, preorder):
+        edges = bucket_edges(start, end, bucket)
+        first, last, mask = self._select(columns, start, end, product_ids, preorder)
+        timestamp = columns.timestamp[first:last]
+        quantity = np.where(mask, columns.quantity[first:last], 0)
+
+        # Row offset of each bucket; reduceat sums from each offset to the next
+        offsets = np.searchsorted(timestamp, [epoch(max(edge, start)) for edge in edges[:-1]])
+        sums = np.zeros(len(offsets), dtype=np.int64)
+        filled = offsets < len(quantity)
+        if filled.any():
+            sums[filled] = np.add.reduceat(quantity, offsets[filled])
+        # reduceat yields the row at the offset (not 0) for a bucket with no rows
+        sums[np.diff(np.append(offsets, len(quantity))) == 0] = 0
+        return [(edge, int(total)) for edge, total in zip(edges, sums)]
+
+
+sales_engine = SalesEngine()
@@ -0,0 +1,79 @@
+import re
+from django.core import checks
+from django.db import connections
+from django.db.models.expressions import RawSQL
+
+
+# SQLite FTS5 index over orders, created and kept in sync by the triggers in
+# migration 0008. `products` holds the order's line item names and SKUs.
+# Migrations that make SQLite rebuild orders_order or orders_lineitem (e.g.
+# adding a column with a default) drop those triggers, see 0011 and 0014.
+FTS_TABLE = 'orders_order_fts'
+FTS_TRIGGERS = [
+    f'{FTS_TABLE}_{name}'
+    for name in ('order_insert', 'order_update', 'order_delete', 'item_insert', 'item_update', 'item_delete')
+]
+
+# Aliases whose database is known to have the index, so it is only looked up once
+_fts_ready = set()
+
+
+def _search_objects(connection):
+    """Names of the index table and its triggers present on `connection`."""
+    names = [FTS_TABLE, *FTS_TRIGGERS]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT name FROM sqlite_master WHERE name IN ({', '.join(['%s'] * len(names))})", names
+        )
+        return {name for name, in cursor.fetchall()}
+
+
+def fts_available(using='default'):
+    """
+    True when the FTS5 index and every trigger keeping it in sync exist on
+    the `using` database. Without the triggers the index would silently
+    miss new and edited orders, so searches fall back to icontains.
+    """
+    if using in _fts_ready:
+        return True
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return False
+    if _search_objects(connection) != {FTS_TABLE, *FTS_TRIGGERS}:
+        return False
+    _fts_ready.add(using)
+    return True
+
+
+@checks.register(checks.Tags.database)
+def check_search_index(app_configs, databases=None, **kwargs):
+    """Warn (on migrate, or check --database) when the index exists but lost its triggers."""
+    errors = []
+    for alias in databases or []:
+        connection = connections[alias]
+        if connection.vendor != 'sqlite':
+            continue
+        present = _search_objects(connection)
+        missing = [name for name in FTS_TRIGGERS if name not in present]
+        if FTS_TABLE in present and missing:
+            errors.append(checks.Warning(
+                f'The order search index on the {alias!r} database is missing its sync triggers '
+                f'({", ".join(missing)}), so search falls back to substring matching.',
+                hint='A migration rebuilt orders_order or orders_lineitem; recreate the index as 0011 and 0014 do.',
+                id='orders.W001',
+            ))
+    return errors
+
+
+def match_expression(query):
+    """
+    FTS5 MATCH expression requiring every word of `query` as a prefix,
+    e.g. 'jane high st' -> '"jane"* "high"* "st"*'. Returns '' if the
+    query has no searchable words.
+    """
+    return ' '.join(f'"{word}"*' for word in re.findall(r'\w+', query))
+
+
+def matching_order_ids(expression):
+    """Subquery of the ids of orders whose index entry matches `expression`."""
+    return RawSQL(f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [expression])
@@ -0,0 +1,74 @@
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+from .events import broadcaster
+from .models import Order, LineItem, Product, DataVersion, OrderStats
+
+
+def publish_version(version):
+    # Only tell pages to refresh once the change is visible to their queries
+    transaction.on_commit(lambda: broadcaster.publish({'version': version}))
+
+
+@receiver(pre_save, sender=Order)
+def stamp_order_version(sender, instance, **kwargs):
+    # Stamped before saving so the changes API can find the order by version
+    instance.version = DataVersion.bump()
+    # Remember the stats group and subtotal the order is leaving. Order.save() runs
+    # this and post_save in one transaction, and the bump above took the write
+    # lock, so nothing can change them before post_save applies the delta
+    instance._stats_before = None
+    if instance.pk is not None:
+        instance._stats_before = (
+            Order.objects.filter(pk=instance.pk).values_list(*OrderStats.KEY_FIELDS, 'subtotal').first()
+        )
+
+
+@receiver(post_save, sender=Order)
+def order_saved(sender, instance, **kwargs):
+    stats = {}
+    before = getattr(instance, '_stats_before', None)
+    if before is not None:
+        OrderStats.add(stats, before[:-1], -1, -OrderStats.amount(before[-1]))
+    OrderStats.add(stats, OrderStats.key(instance), 1, instance.subtotal)
+    OrderStats.apply(stats)
+    publish_version(instance.version)
+
+
+@receiver(post_delete, sender=Order)
+def order_deleted(sender, instance, **kwargs):
+    version = DataVersion.bump()
+    OrderStats.apply({OrderStats.key(instance): (-1, -OrderStats.amount(instance.subtotal))})
+    # Deleted orders leave nothing to fetch, so clients behind this must reload
+    DataVersion.set(DataVersion.ORDERS_RESET, version)
+    publish_version(version)
+
+
+@receiver(pre_save, sender=LineItem)
+def resolve_line_item_product(sender, instance, update_fields=None, **kwargs):
+    # Manually entered items only have a name; the importer resolves its own in bulk
+    if instance.product_id is None:
+        instance.product = Product.resolve(instance.product_name, instance.sku)
+        return
+    if instance.pk is None or (update_fields is not None and not {'product_name', 'sku'} & set(update_fields)):
+        return
+    # Renamed or re-SKUed, unless the product was chosen along with it
+    before = LineItem.objects.filter(pk=instance.pk).values_list('product_id', 'product_name', 'sku').first()
+    if before and before[0] == instance.product_id and before[1:] != (instance.product_name, instance.sku):
+        instance.product = Product.resolve(instance.product_name, instance.sku)
+
+
+@receiver(post_save, sender=LineItem)
+@receiver(post_delete, sender=LineItem)
+def line_item_changed(sender, instance, **kwargs):
+    version = DataVersion.bump()
+    Order.objects.filter(id=instance.order_id).update(version=version)
+    publish_version(version)
+
+
+@receiver(post_save, sender=Product)
+def product_changed(sender, instance, created, **kwargs):
+    if created:
+        return
+    # Reclassified: cached analytics and payments pages count books by product flags
+    publish_version(DataVersion.bump())
@@ -1,3 +1,1572 @@
-from django.test import TestCase
+import asyncio
+import csv
+import json
+import os
+import tempfile
+import threading
+from datetime import UTC, date, datetime, timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO, TextIOWrapper
+from unittest import mock
 
-# Create your tests here.
+import pandas as pd
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.management import CommandError, call_command
+from django.core.management.base import OutputWrapper
+from django.db import connection
+from django.db.models import F, Sum
+from django.http import HttpResponse
+from django.test import TestCase, override_settings
+from django.test.client import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from payments.models import PaymentPeriod
+
+from .benchmark import generate_shopify_export
+from .caching import PAGE_CACHE, cache_by_version
+from .events import OrderEventBroadcaster, broadcaster
+from .importer import (
+    IMPORT_COLUMNS, SHOPIFY_DATE_FORMAT, OrderImporter, iter_order_chunks, merge_order, normalize_chunk,
+    read_csv_chunks,
+)
+from .instrumentation import ProgressReporter, QueryCounter, StageTimer
+from .management.commands.explain_queries import Command as ExplainCommand, plan_problems
+from .models import DataVersion, ImportRun, LineItem, Order, OrderNumberSequence, OrderStats, Product
+from .pagination import keyset_page
+from .periods import SHOP_TIMEZONE, bucket_edges, day_range, shop_date
+from .sales import SalesEngine
+from .search import FTS_TABLE, check_search_index, fts_available, match_expression
+
+
+BOOK = "Through Bear's Eyes"
+
+
+def order_row(name, product, quantity=1, sku='', created_at='2026-06-01 10:00:00 +0100', **columns):
+    """One row of a Shopify order export, as import_orders reads it."""
+    return {
+        'Name': name, 'Created at': created_at, 'Currency': 'GBP', 'Subtotal': '12.99',
+        'Fulfillment Status': '', 'Lineitem name': product, 'Lineitem sku': sku,
+        'Lineitem quantity': str(quantity), 'Shipping Name': 'Jane Doe',
+        'Shipping Address1': '1 High Street', 'Shipping Address2': '', 'Shipping City': 'York',
+        'Shipping Zip': 'YO1 7HH',
+        **columns,
+    }
+
+
+def create_order(number, **fields):
+    return Order.objects.create(
+        order_number=number, customer_name=fields.pop('customer_name', 'Jane Doe'),
+        shipping_address=fields.pop('shipping_address', '1 High Street York'), **fields,
+    )
+
+
+def export_csv(*rows):
+    """`rows` as the text of a Shopify export, with a column the importer ignores."""
+    frame = pd.DataFrame([{**row, 'Email': 'jane@example.com'} for row in rows], columns=IMPORT_COLUMNS + ['Email'])
+    return frame.to_csv(index=False)
+
+
+def export_rows(*rows):
+    """`rows` as the DataFrame chunk read_csv_chunks() yields for them."""
+    return pd.read_csv(StringIO(export_csv(*rows)), dtype=str, usecols=IMPORT_COLUMNS)
+
+
+def shopify_date(value):
+    return datetime.strptime(value, SHOPIFY_DATE_FORMAT)
+
+
+def import_file(path, **options):
+    """Run import_orders on `path`, returning its report."""
+    output = StringIO()
+    call_command('import_orders', path=path, stdout=output, stderr=StringIO(), **options)
+    return output.getvalue()
+
+
+def stdin(text):
+    return TextIOWrapper(BytesIO(text.encode()))
+
+
+def import_rows(*rows, batch_size=1000):
+    importer = OrderImporter(batch_size=batch_size)
+    importer.add_chunk(export_rows(*rows))
+    importer.flush()
+    return importer
+
+
+class MergeRuleTests(TestCase):
+    def test_blank_details_zero_subtotal_and_missing_date_are_filled(self):
+        order = Order(order_number='#1', customer_name='', shipping_address='', subtotal=Decimal('0'))
+        incoming = Order(
+            order_number='#1', customer_name='Jane Doe', shipping_address='1 High Street',
+            subtotal=Decimal('12.99'), order_date=shopify_date('2026-06-01 10:00:00 +0100'),
+        )
+        self.assertTrue(merge_order(order, incoming))
+        self.assertEqual(order.customer_name, 'Jane Doe')
+        self.assertEqual(order.shipping_address, '1 High Street')
+        self.assertEqual(order.subtotal, Decimal('12.99'))
+        self.assertEqual(order.order_date, incoming.order_date)
+
+    def test_existing_values_win(self):
+        order_date = shopify_date('2026-05-01 10:00:00 +0100')
+        order = Order(
+            order_number='#1', customer_name='Jane Doe', shipping_address='1 High Street',
+            subtotal=Decimal('5.00'), order_date=order_date,
+        )
+        incoming = Order(
+            order_number='#1', customer_name='John Roe', shipping_address='2 Low Road',
+            subtotal=Decimal('9.00'), order_date=shopify_date('2026-06-01 10:00:00 +0100'),
+        )
+        self.assertFalse(merge_order(order, incoming))
+        self.assertEqual((order.customer_name, order.subtotal, order.order_date), ('Jane Doe', Decimal('5.00'), order_date))
+
+
+class NormalizeChunkTests(TestCase):
+    def test_orders_and_items_are_reduced_to_one_record_each(self):
+        orders, items = normalize_chunk(export_rows(
+            order_row('#1001', "Through Bear's Eyes", quantity=2, sku='TBE-HB', **{'Shipping Name': '', 'Subtotal': '0'}),
+            order_row('#1001', "Through Bear's Eyes", quantity='1.0', sku='TBE-HB', **{'Shipping Address1': '2 Low Road', 'Subtotal': ''}),
+            order_row('#1001', 'Tote Bag', quantity='', **{'Subtotal': '20.50'}),
+            order_row('', 'Tote Bag'),
+            order_row('#1002', 'Tote Bag', created_at='not a date', **{'Currency': '', 'Fulfillment Status': 'fulfilled'}),
+        ))
+        self.assertEqual(list(orders.index), ['#1001', '#1002'])
+        first = orders.loc['#1001']
+        # The first named row provides the customer, the first non-zero subtotal wins
+        self.assertEqual((first.customer_name, first.shipping_address), ('Jane Doe', '2 Low Road  York YO1 7HH'))
+        self.assertEqual(first.subtotal, 20.5)
+        self.assertEqual(first.order_date, shopify_date('2026-06-01 10:00:00 +0100'))
+        self.assertFalse(first.is_fulfilled)
+        second = orders.loc['#1002']
+        self.assertTrue(pd.isna(second.order_date))
+        self.assertEqual((second.currency, second.is_fulfilled), ('GBP', True))
+        self.assertEqual(
+            list(items.itertuples(index=False, name=None)),
+            [('#1001', "Through Bear's Eyes", 'TBE-HB', 3), ('#1001', 'Tote Bag', '', 1), ('#1002', 'Tote Bag', '', 1)],
+        )
+
+
+class ImportTests(TestCase):
+    def test_rows_of_an_order_are_merged(self):
+        import_rows(
+            order_row('#1001', "Through Bear's Eyes", quantity=2, sku='TBE-HB', **{'Shipping Name': ''}),
+            order_row('#1001', "Through Bear's Eyes", quantity=1, sku='TBE-HB'),
+            order_row('#1001', 'Tote Bag', sku='TOTE-01'),
+        )
+        order = Order.objects.get(order_number='#1001')
+        self.assertEqual(order.customer_name, 'Jane Doe')
+        self.assertEqual(order.shipping_address, '1 High Street  York YO1 7HH')
+        self.assertEqual(
+            sorted(order.items.values_list('product_name', 'quantity')),
+            [("Through Bear's Eyes", 3), ('Tote Bag', 1)],
+        )
+
+    def test_existing_orders_are_merged_not_duplicated(self):
+        import_rows(order_row('#1001', 'Tote Bag', sku='TOTE-01', **{'Subtotal': '0', 'Shipping Name': ''}))
+        importer = import_rows(order_row('#1001', 'Bear Bookmark', sku='BM-BEAR'))
+        self.assertEqual((importer.stats['orders_created'], importer.stats['orders_updated']), (0, 1))
+        order = Order.objects.get()
+        self.assertEqual((order.customer_name, order.subtotal), ('Jane Doe', Decimal('12.99')))
+        self.assertEqual(order.items.count(), 2)
+
+    def test_rows_without_an_order_number_are_skipped(self):
+        importer = import_rows(order_row('', 'Tote Bag'), order_row('#1001', 'Tote Bag'))
+        self.assertEqual((importer.stats['rows'], importer.stats['skipped_rows']), (2, 1))
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_batches_end_on_order_boundaries(self):
+        import_rows(
+            order_row('#1001', "Through Bear's Eyes", sku='TBE-HB'),
+            order_row('#1002', 'Tote Bag', sku='TOTE-01'),
+            order_row('#1002', 'Bear Bookmark', sku='BM-BEAR'),
+            order_row('#1003', 'Tote Bag', sku='TOTE-01'),
+            batch_size=1,
+        )
+        self.assertEqual(Order.objects.count(), 3)
+        self.assertEqual(LineItem.objects.filter(order__order_number='#1002').count(), 2)
+
+    def test_query_count_does_not_grow_with_the_batch(self):
+        def queries(first, count):
+            rows = [order_row(f'#{n}', 'Tote Bag', sku='TOTE-01') for n in range(first, first + count)]
+            with CaptureQueriesContext(connection) as context:
+                import_rows(*rows)
+            return len(context)
+
+        queries(1, 1)  # creates the OrderStats row the later imports update
+        self.assertEqual(queries(10, 2), queries(100, 50))
+
+
+class ExportFileMixin:
+    def write_export(self, *rows):
+        fd, path = tempfile.mkstemp(suffix='.csv')
+        with os.fdopen(fd, 'w') as export:
+            export.write(export_csv(*rows))
+        self.addCleanup(os.remove, path)
+        return path
+
+
+class StreamingImportTests(ExportFileMixin, TestCase):
+
+    def test_rows_are_read_in_chunks(self):
+        rows = [order_row(f'#{n}', 'Tote Bag', sku='TOTE-01', **{'Shipping Zip': '01234'}) for n in range(5)]
+        chunks = list(read_csv_chunks(StringIO(export_csv(*rows)), chunk_size=2))
+        self.assertEqual([len(chunk) for chunk in chunks], [2, 2, 1])
+        # Only the imported columns are kept, as strings
+        self.assertEqual(list(chunks[0].columns), IMPORT_COLUMNS)
+        self.assertEqual(chunks[2].iloc[0]['Shipping Zip'], '01234')
+
+    def test_an_order_split_across_chunks_is_imported_once(self):
+        path = self.write_export(
+            order_row('#1001', "Through Bear's Eyes", sku='TBE-HB'),
+            order_row('#1001', "Through Bear's Eyes", quantity=2, sku='TBE-HB'),
+            order_row('#1001', 'Tote Bag', sku='TOTE-01'),
+        )
+        import_file(path, chunk_size=1)
+        self.assertEqual(
+            sorted(LineItem.objects.values_list('order__order_number', 'product_name', 'quantity')),
+            [('#1001', "Through Bear's Eyes", 3), ('#1001', 'Tote Bag', 1)],
+        )
+
+    def test_export_from_stdin(self):
+        with mock.patch('sys.stdin', stdin(export_csv(order_row('#1001', 'Tote Bag')))):
+            import_file('-')
+        self.assertTrue(Order.objects.filter(order_number='#1001').exists())
+
+    def test_missing_file(self):
+        self.assertIn('CSV file not found', import_file('/nonexistent/orders_export.csv'))
+
+
+class ReimportTests(ExportFileMixin, TestCase):
+    def test_reimport_is_idempotent(self):
+        rows = [
+            order_row('#1001', "Through Bear's Eyes", quantity=2, sku='TBE-HB'),
+            order_row('#1001', "Through Bear's Eyes", sku='TBE-HB'),
+            order_row('#1002', 'Tote Bag', sku='TOTE-01', **{'Subtotal': '0'}),
+        ]
+        import_rows(*rows)
+        updated_at = dict(Order.objects.values_list('order_number', 'updated_at'))
+        importer = import_rows(*rows)
+        self.assertEqual(importer.stats['orders_created'] + importer.stats['orders_updated'], 0)
+        self.assertEqual(importer.stats['items_created'] + importer.stats['items_merged'], 0)
+        self.assertEqual(dict(Order.objects.values_list('order_number', 'updated_at')), updated_at)
+        self.assertEqual(
+            sorted(LineItem.objects.values_list('product_name', 'quantity')),
+            [("Through Bear's Eyes", 3), ('Tote Bag', 1)],
+        )
+
+    def test_quantities_are_taken_from_the_export(self):
+        import_rows(order_row('#1001', "Through Bear's Eyes", sku='TBE-HB'))
+        importer = import_rows(order_row('#1001', "Through Bear's Eyes", quantity=4, sku='TBE-HB'))
+        self.assertEqual(importer.stats['items_merged'], 1)
+        self.assertEqual(LineItem.objects.get().quantity, 4)
+
+    def test_runs_are_recorded_in_the_ledger(self):
+        path = self.write_export(
+            order_row('#1001', 'Tote Bag', created_at='2026-06-05 09:00:00 +0100'),
+            order_row('#1002', 'Tote Bag', created_at='2026-06-01 09:00:00 +0100'),
+        )
+        import_file(path)
+        run = ImportRun.objects.get()
+        self.assertEqual(run.source, path)
+        self.assertEqual(len(run.checksum), 64)
+        self.assertEqual(run.row_count, 2)
+        self.assertEqual(run.watermark, shopify_date('2026-06-05 09:00:00 +0100'))
+        self.assertIsNotNone(run.completed_at)
+        self.assertEqual(ImportRun.latest_watermark(), run.watermark)
+
+    def test_an_imported_file_is_only_imported_again_with_force(self):
+        path = self.write_export(order_row('#1001', 'Tote Bag'))
+        import_file(path)
+        Order.objects.all().delete()
+        self.assertIn('already imported', import_file(path))
+        self.assertFalse(Order.objects.exists())
+        import_file(path, force=True)
+        self.assertTrue(Order.objects.exists())
+        self.assertEqual(ImportRun.objects.count(), 2)
+
+    def test_stdin_imports_are_checksummed(self):
+        export = export_csv(order_row('#1001', 'Tote Bag'))
+        path = self.write_export(order_row('#1001', 'Tote Bag'))
+        with mock.patch('sys.stdin', stdin(export)):
+            import_file('-')
+        run = ImportRun.objects.get()
+        self.assertEqual(run.source, '<stdin>')
+        # The same export from a file is recognised as already imported
+        self.assertIn('already imported', import_file(path))
+
+    def test_orders_older_than_earlier_imports_are_still_imported(self):
+        # The tail of an export, then the whole of it
+        tail = order_row('#1002', 'Tote Bag', created_at='2026-06-05 09:00:00 +0100')
+        import_file(self.write_export(tail))
+        output = import_file(self.write_export(
+            order_row('#1001', 'Tote Bag', created_at='2026-06-01 09:00:00 +0100'), tail,
+        ))
+        self.assertEqual(sorted(Order.objects.values_list('order_number', flat=True)), ['#1001', '#1002'])
+        self.assertIn('1 created, 0 updated', output)
+
+    def test_settled_orders_are_left_alone(self):
+        import_file(self.write_export(
+            order_row('#1001', 'Tote Bag', created_at='2026-05-01 09:00:00 +0100'),
+            order_row('#1002', 'Tote Bag', created_at='2026-06-01 09:00:00 +0100'),
+        ))
+        # #1001 is weeks older than the watermark, #1002 inside the overlap
+        output = import_file(self.write_export(
+            order_row('#1000', 'Tote Bag', created_at='2026-04-01 09:00:00 +0100'),
+            order_row('#1001', 'Tote Bag', quantity=5, created_at='2026-05-01 09:00:00 +0100'),
+            order_row('#1002', 'Tote Bag', quantity=3, created_at='2026-06-01 09:00:00 +0100'),
+        ))
+        self.assertIn('1 created, 0 updated, 1 line items created, 1 merged, 1 settled orders', output)
+        self.assertEqual(
+            sorted(LineItem.objects.values_list('order__order_number', 'quantity')),
+            [('#1000', 1), ('#1001', 1), ('#1002', 3)],
+        )
+        output = import_file(self.write_export(
+            order_row('#1001', 'Tote Bag', quantity=5, created_at='2026-05-01 09:00:00 +0100'),
+        ), full=True)
+        self.assertIn('1 merged, 0 settled orders', output)
+
+    def test_settled_orders_continuing_across_chunks_are_merged(self):
+        importer = OrderImporter(watermark=shopify_date('2026-06-01 09:00:00 +0100'))
+        row = order_row('#1001', 'Tote Bag', created_at='2026-01-01 09:00:00 +0100')
+        importer.add_chunk(export_rows(row))
+        importer.add_chunk(export_rows(row))
+        importer.flush()
+        self.assertEqual(LineItem.objects.get().quantity, 2)
+        self.assertEqual(importer.stats['settled_orders'], 0)
+
+
+class ParallelImportTests(ExportFileMixin, TestCase):
+    def rows(self):
+        # Orders of one, two and three rows, with a nameless row, so chunks of
+        # two rows cut through most of them
+        return [
+            order_row('#1001', "Through Bear's Eyes", sku='TBE-HB'),
+            order_row('#1002', "Through Bear's Eyes", sku='TBE-HB'),
+            order_row('#1002', 'Tote Bag', quantity=2, sku='TOTE-01'),
+            order_row('', 'Tote Bag'),
+            order_row('#1003', 'Bear Bookmark', sku='BM-BEAR'),
+            order_row('#1003', 'Tote Bag', sku='TOTE-01'),
+            order_row('#1003', 'Bear Bookmark', sku='BM-BEAR'),
+            order_row('#1004', 'Tote Bag', sku='TOTE-01'),
+        ]
+
+    def test_chunks_are_recut_on_order_boundaries(self):
+        chunks = list(iter_order_chunks(read_csv_chunks(StringIO(export_csv(*self.rows())), chunk_size=2)))
+        names = [list(chunk['Name'].fillna('')) for chunk in chunks]
+        self.assertEqual(names, [['#1001'], ['#1002', '#1002', ''], ['#1003', '#1003', '#1003'], ['#1004']])
+        self.assertEqual(sum(len(chunk) for chunk in chunks), len(self.rows()))
+
+    def test_leading_rows_without_an_order_are_kept(self):
+        chunks = list(iter_order_chunks(read_csv_chunks(StringIO(export_csv(
+            order_row('', 'Tote Bag'), order_row('', 'Tote Bag'), order_row('#1001', 'Tote Bag'),
+        )), chunk_size=2)))
+        self.assertEqual([list(chunk['Name'].fillna('')) for chunk in chunks], [['', ''], ['#1001']])
+
+    def imported(self):
+        return sorted(LineItem.objects.values_list('order__order_number', 'product_name', 'quantity'))
+
+    def test_workers_import_the_same_as_one_process(self):
+        path = self.write_export(*self.rows())
+        import_file(path, chunk_size=2)
+        expected = self.imported()
+        Order.objects.all().delete()
+
+        output = import_file(path, chunk_size=2, workers=2, force=True)
+        self.assertEqual(self.imported(), expected)
+        self.assertIn('1 rows without an order number skipped', output)
+        self.assertRegex(output, r'Processed 8 rows in [0-9.]+s \([0-9]+ rows/s')
+
+
+class BenchmarkTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def path(self, name):
+        return os.path.join(self.directory.name, name)
+
+    def test_generated_export_looks_like_shopify(self):
+        # Starts two days before the clocks go back
+        path = generate_shopify_export(self.path('orders.csv'), 1500, start=datetime(2025, 10, 24))
+        with open(path, newline='') as export:
+            rows = list(csv.DictReader(export))
+        self.assertEqual(len(rows), 1500)
+        self.assertEqual({row['Created at'][-5:] for row in rows}, {'+0100', '+0000'})
+        self.assertTrue(any('Pre-Order' in row['Lineitem name'] for row in rows))
+
+        orders = {}
+        for row in rows:
+            orders.setdefault(row['Name'], []).append(row)
+        self.assertTrue(any(len(lines) > 1 for lines in orders.values()))
+        self.assertTrue(any(
+            len({line['Lineitem sku'] for line in lines}) < len(lines) for lines in orders.values()
+        ))
+        for lines in orders.values():
+            # Order-level columns are only on an order's first row
+            self.assertTrue(lines[0]['Shipping Name'] and lines[0]['Subtotal'])
+            self.assertFalse(any(line['Shipping Name'] or line['Subtotal'] for line in lines[1:]))
+
+    def test_generated_export_is_reproducible_and_imports(self):
+        first = generate_shopify_export(self.path('first.csv'), 300, seed=7)
+        second = generate_shopify_export(self.path('second.csv'), 300, seed=7)
+        with open(first) as a, open(second) as b:
+            self.assertEqual(a.read(), b.read())
+
+        counter = QueryCounter()
+        with connection.execute_wrapper(counter):
+            import_file(first)
+        self.assertGreater(counter.count, 0)
+        with open(first, newline='') as export:
+            rows = list(csv.DictReader(export))
+        self.assertEqual(Order.objects.count(), len({row['Name'] for row in rows}))
+        self.assertEqual(
+            sum(LineItem.objects.values_list('quantity', flat=True)),
+            sum(int(row['Lineitem quantity']) for row in rows),
+        )
+
+    def test_benchmark_reports_and_compares_runs(self):
+        results = self.path('results.json')
+        output = StringIO()
+        call_command(
+            'benchmark_import', sizes=[200], output_dir=self.directory.name, json=results,
+            stdout=output, stderr=StringIO(),
+        )
+        self.assertIn('rows/s', output.getvalue())
+        with open(results) as f:
+            run = json.load(f)['results'][0]
+        self.assertEqual(run['rows'], 200)
+        self.assertGreater(run['sql_statements'], 0)
+
+        # A baseline twice as fast with half the statements is a regression
+        run.update(rows_per_second=run['rows_per_second'] * 2, sql_statements=run['sql_statements'] // 2)
+        with open(self.path('baseline.json'), 'w') as f:
+            json.dump({'results': [run]}, f)
+        with self.assertRaisesMessage(CommandError, 'Import performance regressed'):
+            call_command(
+                'benchmark_import', sizes=[200], output_dir=self.directory.name,
+                compare=self.path('baseline.json'), stdout=StringIO(), stderr=StringIO(),
+            )
+
+
+class InstrumentationTests(ExportFileMixin, TestCase):
+    def test_stage_timer_accumulates_stages(self):
+        timer = StageTimer()
+        with timer.stage('write'):
+            pass
+        with timer.stage('write'):
+            pass
+        self.assertEqual(list(timer.iterate('read', 'ab')), ['a', 'b'])
+        summary = timer.summary()
+        self.assertEqual(summary['write']['calls'], 2)
+        # One step per item plus the one that ends the iteration
+        self.assertEqual(summary['read']['calls'], 3)
+
+    def test_progress_shows_rate_and_eta(self):
+        output = StringIO()
+        progress = ProgressReporter(OutputWrapper(output), total_bytes=1000, interval=60)
+        progress.update(10, 250, force=True)
+        progress.update(20, 500)  # Throttled
+        progress.finish(40)
+        lines = output.getvalue().split('\r')
+        self.assertRegex(lines[1], r'^10 rows, \d+ rows/s, 25%, ETA \d+s')
+        self.assertRegex(lines[2], r'^40 rows, \d+ rows/s')
+        self.assertEqual(len(lines), 3)
+
+    def test_summary_json_and_stage_report(self):
+        path = self.write_export(
+            order_row('#1001', 'Tote Bag'), order_row('#1001', 'Bear Bookmark'), order_row('', 'Tote Bag'),
+        )
+        summary_path = path + '.json'
+        self.addCleanup(os.remove, summary_path)
+        output, progress = StringIO(), StringIO()
+        call_command('import_orders', path=path, summary_json=summary_path, verbosity=2, stdout=output, stderr=progress)
+        self.assertRegex(output.getvalue(), r'\d+ queries in [0-9.]+s')
+        self.assertRegex(output.getvalue(), r'write_items +[0-9.]+s +\(1 calls\)')
+        self.assertIn('3 rows', progress.getvalue())
+
+        with open(summary_path) as f:
+            summary = json.load(f)
+        self.assertEqual(summary['source'], path)
+        self.assertEqual(summary['checksum'], ImportRun.objects.get().checksum)
+        self.assertEqual(
+            {name: summary['counters'][name] for name in ('rows', 'skipped_rows', 'orders_created', 'items_created')},
+            {'rows': 3, 'skipped_rows': 1, 'orders_created': 1, 'items_created': 2},
+        )
+        self.assertEqual(
+            set(summary['stages']),
+            {'read', 'normalize', 'prepare', 'lookup_orders', 'write_orders', 'lookup_items', 'write_items'},
+        )
+        self.assertGreater(summary['queries']['count'], 0)
+
+    def test_no_progress_when_quiet(self):
+        progress = StringIO()
+        path = self.write_export(order_row('#1001', 'Tote Bag'))
+        call_command('import_orders', path=path, verbosity=0, stdout=StringIO(), stderr=progress)
+        self.assertEqual(progress.getvalue(), '')
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        # Ten orders whose subtotals tie in pairs, so pages must break ties on id
+        self.orders = [create_order(f'#{n}', subtotal=n // 2) for n in range(10)]
+
+    def walk(self, sort_option, per_page):
+        pages = [keyset_page(Order.objects.all(), sort_option, per_page)]
+        while pages[-1].has_next:
+            pages.append(keyset_page(Order.objects.all(), sort_option, per_page, after=pages[-1].next_cursor))
+        return pages
+
+    def test_forward_pages_cover_every_order_once_in_order(self):
+        for sort_option, expected in (
+            ('value_low', sorted(self.orders, key=lambda o: (o.subtotal, o.id))),
+            ('value_high', sorted(self.orders, key=lambda o: (o.subtotal, o.id), reverse=True)),
+        ):
+            pages = self.walk(sort_option, 3)
+            self.assertEqual([o.id for page in pages for o in page], [o.id for o in expected])
+            self.assertEqual([len(page) for page in pages], [3, 3, 3, 1])
+            self.assertFalse(pages[0].has_previous)
+            self.assertTrue(all(page.has_previous for page in pages[1:]))
+
+    def test_backward_pages_mirror_the_forward_ones(self):
+        pages = self.walk('value_high', 3)
+        for previous, page in zip(pages, pages[1:]):
+            back = keyset_page(Order.objects.all(), 'value_high', 3, before=page.previous_cursor)
+            self.assertEqual([o.id for o in back], [o.id for o in previous])
+            self.assertEqual(back.has_previous, previous.has_previous)
+            self.assertTrue(back.has_next)
+
+    def test_ties_on_created_at(self):
+        Order.objects.update(created_at=self.orders[0].created_at)
+        pages = self.walk('newest', 4)
+        self.assertEqual([o.id for page in pages for o in page], sorted((o.id for o in self.orders), reverse=True))
+
+    def test_cursor_stays_valid_after_its_order_leaves_the_list(self):
+        unpacked = Order.objects.filter(is_packed=False)
+        first = keyset_page(unpacked, 'oldest', 3)
+        Order.objects.filter(id=first.next_cursor).update(is_packed=True)
+        second = keyset_page(unpacked, 'oldest', 3, after=first.next_cursor)
+        self.assertEqual([o.id for o in second], [o.id for o in self.orders[3:6]])
+        self.assertTrue(second.has_previous)
+
+    def test_unknown_cursor_starts_over(self):
+        page = keyset_page(Order.objects.all(), 'oldest', 3, after='nonsense')
+        self.assertEqual([o.id for o in page], [o.id for o in self.orders[:3]])
+
+
+class SuperuserTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='admin', is_staff=True, is_superuser=True)
+        self.client.force_login(self.user)
+        # Page cache keys and the loaded sales restart with the data versions in every test
+        caches[PAGE_CACHE].clear()
+        engine = mock.patch('orders.sales.sales_engine', SalesEngine())
+        engine.start()
+        self.addCleanup(engine.stop)
+
+
+class OrderListViewTests(SuperuserTestCase):
+    def setUp(self):
+        super().setUp()
+        self.orders = [create_order(f'#{1000 + n}') for n in range(30)]
+
+    def numbers(self, response):
+        return [order.order_number for order in response.context['orders']]
+
+    def test_list_previews_the_first_orders(self):
+        response = self.client.get(reverse('order_list'))
+        self.assertEqual(self.numbers(response), ['#1000', '#1001', '#1002', '#1003', '#1004'])
+        self.assertTrue(response.context['showing_limited'])
+
+    def test_tabs_count_their_orders(self):
+        Order.objects.filter(pk__in=[order.pk for order in self.orders[:4]]).update_tracked(is_packed=True)
+        self.assertEqual(self.client.get(reverse('order_list')).context['tab_count'], 26)
+        self.assertEqual(self.client.get(reverse('order_list'), {'status': 'verification'}).context['tab_count'], 4)
+        response = self.client.get(reverse('order_list'), {'status': 'packed', 'q': '1002'})
+        self.assertEqual(response.context['tab_count'], 1)
+        self.assertContains(response, '<span class="badge bg-white text-primary ms-1">1</span>', html=True)
+        self.assertNotIn('tab_count', self.client.get(reverse('order_list'), {'fragment': '1'}).context)
+        self.assertIsNone(response.context['next_page_url'])
+
+    def test_view_all_scrolls_through_fragments(self):
+        response = self.client.get(reverse('order_list'), {'view_all': 'true', 'sort': 'newest'})
+        numbers = self.numbers(response)
+        self.assertEqual(len(numbers), 25)
+        fragment = self.client.get(response.context['next_page_url'])
+        self.assertTemplateUsed(fragment, 'orders/includes/order_cards.html')
+        self.assertTemplateNotUsed(fragment, 'orders/order_list.html')
+        numbers += self.numbers(fragment)
+        self.assertEqual(numbers, [f'#{1000 + n}' for n in reversed(range(30))])
+        self.assertIsNone(fragment.context['next_page_url'])
+
+    def test_simplified_view_steps_by_cursor(self):
+        url = reverse('simplified_view')
+        first = self.client.get(url).context['page_obj']
+        self.assertEqual([o.order_number for o in first], ['#1000'])
+        second = self.client.get(url, {'after': first.next_cursor}).context['page_obj']
+        self.assertEqual([o.order_number for o in second], ['#1001'])
+        back = self.client.get(url, {'before': second.previous_cursor}).context['page_obj']
+        self.assertEqual([o.order_number for o in back], ['#1000'])
+
+    def test_simplified_view_falls_back_when_the_last_order_is_packed(self):
+        last = self.orders[-1]
+        Order.objects.filter(id=last.id).update(is_packed=True)
+        page = self.client.get(reverse('simplified_view'), {'after': last.id}).context['page_obj']
+        self.assertEqual([o.order_number for o in page], ['#1028'])
+
+
+class OrderQuerySetTests(TestCase):
+    def test_search_and_sorting(self):
+        create_order('#1001', customer_name='Jane Doe', subtotal=5)
+        create_order('#1002', customer_name='John Roe', shipping_address='2 Low Road Leeds', subtotal=20)
+        create_order('#1003', customer_name='Amy Poe', subtotal=20)
+        self.assertEqual(list(Order.objects.search('leeds').values_list('order_number', flat=True)), ['#1002'])
+        self.assertEqual(Order.objects.search('').count(), 3)
+        self.assertEqual(
+            list(Order.objects.sorted_by('value_high').values_list('order_number', flat=True)),
+            ['#1003', '#1002', '#1001'],
+        )
+
+    def test_for_display_annotates_items(self):
+        order = create_order('#1001')
+        LineItem.objects.create(order=order, product_name='Tote Bag', quantity=2)
+        LineItem.objects.create(order=order, product_name='Bear Bookmark', quantity=3)
+        shown = Order.objects.for_display().get()
+        self.assertEqual(shown.item_count, 2)
+        self.assertFalse(hasattr(shown, 'total_quantity'))
+        with self.assertNumQueries(0):
+            self.assertEqual(len(shown.items.all()), 2)
+
+    def test_for_display_counts_zero_for_an_order_without_items(self):
+        create_order('#1001')
+        shown = Order.objects.for_display().get()
+        self.assertEqual(shown.item_count, 0)
+
+
+@override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'pages': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+})
+class OrderPageQueryTests(SuperuserTestCase):
+    def create_orders(self, count):
+        for n in range(count):
+            order = create_order(f'#{Order.objects.count() + 1000}')
+            LineItem.objects.create(order=order, product_name='Tote Bag', quantity=1)
+            LineItem.objects.create(order=order, product_name='Bear Bookmark', quantity=1)
+
+    def queries(self, url, **params):
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(self.client.get(url, params).status_code, 200)
+        return len(context)
+
+    def test_pages_cost_the_same_however_many_orders_they_show(self):
+        # Pick up the CSRF cookie, without which pages skip the cache lookup
+        self.client.get(reverse('order_list'))
+        pages = [
+            (reverse('order_list'), {'view_all': 'true'}),
+            (reverse('simplified_view'), {}),
+            (reverse('dashboard'), {}),
+        ]
+        self.create_orders(2)
+        few = [self.queries(url, **params) for url, params in pages]
+        self.create_orders(20)
+        self.assertEqual([self.queries(url, **params) for url, params in pages], few)
+
+
+class OrderSearchTests(TestCase):
+    def setUp(self):
+        self.jane = create_order('#1001', customer_name='Jane Smith', shipping_address='12 High Street, York')
+        LineItem.objects.create(order=self.jane, product_name='Tote Bag', sku='TOTE-01', quantity=1)
+        self.ravi = create_order('#1002', customer_name='Ravi Patel', shipping_address='3 Mill Lane, Leeds')
+        LineItem.objects.create(order=self.ravi, product_name='Bear Bookmark', sku='BM-02', quantity=1)
+
+    def numbers(self, query):
+        return sorted(Order.objects.search(query).values_list('order_number', flat=True))
+
+    def test_index_is_available(self):
+        self.assertTrue(fts_available())
+
+    def test_match_expression(self):
+        self.assertEqual(match_expression('jane  high-st'), '"jane"* "high"* "st"*')
+        self.assertEqual(match_expression('!!'), '')
+
+    def test_every_word_must_match_as_a_prefix(self):
+        self.assertEqual(self.numbers('jan'), ['#1001'])
+        self.assertEqual(self.numbers('jane high'), ['#1001'])
+        self.assertEqual(self.numbers('jane leeds'), [])
+        self.assertEqual(self.numbers('1002'), ['#1002'])
+        self.assertEqual(self.numbers('bookm'), ['#1002'])
+        self.assertEqual(self.numbers('tote-01'), ['#1001'])
+
+    def test_index_follows_line_item_changes(self):
+        item = self.jane.items.get()
+        item.product_name = 'Enamel Pin'
+        item.save()
+        self.assertEqual(self.numbers('enamel'), ['#1001'])
+        self.assertEqual(self.numbers('bag'), [])
+        item.delete()
+        self.assertEqual(self.numbers('enamel'), [])
+        postcard = Product.resolve('Postcard')
+        LineItem.objects.bulk_create([LineItem(order=self.ravi, product=postcard, product_name='Postcard', quantity=1)])
+        self.assertEqual(self.numbers('postc'), ['#1002'])
+
+    def test_index_follows_order_edits_and_deletes(self):
+        Order.objects.filter(pk=self.ravi.pk).update(customer_name='Ravi Shah')
+        self.assertEqual(self.numbers('shah'), ['#1002'])
+        self.jane.delete()
+        self.assertEqual(self.numbers('jane'), [])
+
+    def test_query_without_words_falls_back_to_substring_match(self):
+        create_order('#1003', customer_name='A+B Books')
+        self.assertEqual(self.numbers('+'), ['#1003'])
+
+    @mock.patch('orders.search._fts_ready', set())
+    def test_missing_trigger_falls_back_to_substring_match(self):
+        self.assertEqual(check_search_index(None, databases=['default']), [])
+        with connection.cursor() as cursor:
+            cursor.execute(f'DROP TRIGGER {FTS_TABLE}_item_insert')
+        self.assertFalse(fts_available())
+        self.assertEqual(self.numbers('ravi'), ['#1002'])
+        self.assertEqual(self.numbers('jane high'), [])
+        warnings = check_search_index(None, databases=['default'])
+        self.assertEqual([warning.id for warning in warnings], ['orders.W001'])
+        self.assertIn('item_insert', warnings[0].msg)
+
+
+class ExplainQueriesTests(TestCase):
+    def test_plan_problems(self):
+        self.assertEqual(plan_problems('SCAN orders_order', limited=True), 'full table scan')
+        self.assertEqual(plan_problems('SCAN orders_order USING INDEX order_date_idx', limited=False), 'full index scan')
+        self.assertIsNone(plan_problems('SCAN orders_order USING INDEX order_date_idx', limited=True))
+        self.assertEqual(plan_problems('USE TEMP B-TREE FOR ORDER BY', limited=True), 'temp b-tree sort')
+        self.assertIsNone(plan_problems('SEARCH orders_order USING INDEX order_date_idx (order_date>?)', limited=False))
+        self.assertIsNone(plan_problems('SCAN orders_order_fts VIRTUAL TABLE INDEX 0:M1', limited=False))
+
+    def explain(self, queryset):
+        out = StringIO()
+        command = ExplainCommand(stdout=out)
+        return command.explain(*queryset.query.sql_with_params(), verbosity=2), out.getvalue()
+
+    def test_order_list_pages_use_the_partial_indexes(self):
+        for packed in (False, True):
+            for ordering in (['created_at', 'id'], ['-created_at', '-id'], ['subtotal', 'id'], ['-subtotal', '-id']):
+                flagged, plan = self.explain(Order.objects.filter(is_packed=packed).order_by(*ordering)[:50])
+                self.assertEqual(flagged, 0, plan)
+                self.assertIn('_idx', plan)
+
+    def test_reports_flagged_plans(self):
+        out = StringIO()
+        call_command('explain_queries', stdout=out)
+        self.assertIn('order_list status=unpacked sort=oldest', out.getvalue())
+        with mock.patch('orders.management.commands.explain_queries.plan_problems', return_value='full table scan'):
+            call_command('explain_queries', stdout=out)
+            self.assertIn('<- full table scan', out.getvalue())
+            self.assertIn('query plan step(s) flagged', out.getvalue())
+            with self.assertRaisesMessage(CommandError, 'query plan step(s) flagged'):
+                call_command('explain_queries', '--fail-on-problems', stdout=StringIO())
+
+
+class OrderEventTests(SuperuserTestCase):
+    async def test_broadcaster_keeps_the_latest_event_per_subscriber(self):
+        events = OrderEventBroadcaster()
+        queue = events.subscribe()
+        # Published from another thread, as sync views do under ASGI
+        publisher = threading.Thread(target=lambda: [events.publish({'n': n}) for n in range(3)])
+        publisher.start()
+        publisher.join()
+        await asyncio.sleep(0)
+        self.assertEqual(await queue.get(), {'n': 2})
+        self.assertTrue(queue.empty())
+        events.unsubscribe(queue)
+        events.publish({'n': 3})
+        await asyncio.sleep(0)
+        self.assertTrue(queue.empty())
+
+    def test_changes_are_published_after_commit(self):
+        with mock.patch.object(broadcaster, 'publish') as publish:
+            with self.captureOnCommitCallbacks(execute=True):
+                order = create_order('#1001')
+                self.assertFalse(publish.called)
+            self.assertEqual(publish.call_args.args[0], {'version': DataVersion.current()})
+            with self.captureOnCommitCallbacks(execute=True):
+                LineItem.objects.create(order=order, product_name='Tote Bag', quantity=1)
+                order.delete()
+        self.assertEqual(publish.call_count, 4)
+
+    def test_wsgi_requests_are_told_to_poll(self):
+        self.assertEqual(self.client.get(reverse('order_events')).status_code, 204)
+
+    async def test_stream_requires_login(self):
+        response = await self.async_client.get(reverse('order_events'))
+        self.assertEqual(response.status_code, 403)
+
+    async def test_stream_sends_current_state_then_changes(self):
+        version = await DataVersion.objects.filter(key=DataVersion.ORDERS).values_list('version', flat=True).afirst()
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(reverse('order_events'))
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = aiter(response.streaming_content)
+        first = (await anext(stream)).decode()
+        self.assertIn(json.dumps({'version': version}), first)
+        self.assertTrue(first.startswith('retry: 5000\n'))
+
+        pending = asyncio.ensure_future(anext(stream))
+        await asyncio.sleep(0)
+        broadcaster.publish({'version': version + 1})
+        self.assertEqual((await asyncio.wait_for(pending, 1)).decode(), f'data: {{"version": {version + 1}}}\n\n')
+        await stream.aclose()
+
+    async def test_idle_stream_picks_up_changes_from_other_processes(self):
+        await self.async_client.aforce_login(self.user)
+        with mock.patch('orders.views.EVENT_STREAM_HEARTBEAT', 0.01):
+            response = await self.async_client.get(reverse('order_events'))
+            stream = aiter(response.streaming_content)
+            await anext(stream)
+            self.assertEqual(await anext(stream), b': keep-alive\n\n')
+            # A bump that never went through the broadcaster, as import_orders does
+            await DataVersion.objects.filter(key=DataVersion.ORDERS).aupdate(version=F('version') + 1)
+            version = await DataVersion.objects.filter(key=DataVersion.ORDERS).values_list('version', flat=True).afirst()
+            self.assertEqual(await anext(stream), f'data: {{"version": {version}}}\n\n'.encode())
+            await stream.aclose()
+
+
+class CheckUpdatesTests(SuperuserTestCase):
+    def test_changes_bump_the_version(self):
+        start = DataVersion.current()
+        order = create_order('#1001')
+        item = LineItem.objects.create(order=order, product_name='Tote Bag', quantity=1)
+        item.delete()
+        self.assertEqual(DataVersion.current(), start + 3)
+
+    def test_import_bumps_the_version_once_per_flush_that_writes(self):
+        start = DataVersion.current()
+        rows = [order_row('#1001', 'Tote Bag'), order_row('#1002', 'Bear Bookmark')]
+        import_rows(*rows)
+        self.assertEqual(DataVersion.current(), start + 1)
+        import_rows(*rows)
+        self.assertEqual(DataVersion.current(), start + 1)
+
+    def test_etag_and_not_modified(self):
+        url = reverse('check_updates')
+        response = self.client.get(url)
+        version = DataVersion.current()
+        self.assertEqual(response.json(), {'version': version})
+        self.assertEqual(response['ETag'], f'"orders-{version}"')
+
+        with self.assertNumQueries(1):
+            response = self.client.get(url, headers={'If-None-Match': f'"orders-{version}"'})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+        create_order('#1001')
+        response = self.client.get(url, headers={'If-None-Match': f'"orders-{version}"'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'version': version + 1})
+
+
+class OrderChangesTests(SuperuserTestCase):
+    def changes(self, since, **params):
+        response = self.client.get(reverse('order_changes'), {'since': since, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_orders_are_stamped_with_the_version_of_their_last_change(self):
+        order = create_order('#1001')
+        self.assertEqual(order.version, DataVersion.current())
+        LineItem.objects.create(order=order, product_name='Tote Bag', quantity=1)
+        order.refresh_from_db()
+        self.assertEqual(order.version, DataVersion.current())
+
+    def test_import_stamps_each_flush_with_one_version(self):
+        import_rows(order_row('#1001', 'Tote Bag'), order_row('#1002', 'Bear Bookmark'))
+        versions = set(Order.objects.values_list('version', flat=True))
+        self.assertEqual(versions, {DataVersion.current()})
+
+    def test_returns_orders_changed_since_the_client_version(self):
+        create_order('#1001')
+        since = DataVersion.current()
+        order = create_order('#1002', customer_name='Ravi Patel')
+        LineItem.objects.create(order=order, product_name='Tote Bag', sku='TOTE-01', quantity=2)
+
+        data = self.changes(since, status='unpacked')
+        self.assertEqual(data['version'], DataVersion.current())
+        self.assertFalse(data['reload'])
+        [change] = data['orders']
+        self.assertEqual(change['order_number'], '#1002')
+        self.assertEqual(change['items'], [['Tote Bag', 'TOTE-01', 2]])
+        self.assertIn('Ravi Patel', change['html'])
+        self.assertIn('Mark Packed', change['html'])
+        self.assertEqual(self.changes(data['version'])['orders'], [])
+
+    def test_deletions_since_the_client_version_ask_for_a_reload(self):
+        order = create_order('#1001')
+        since = DataVersion.current()
+        order.delete()
+        data = self.changes(since)
+        self.assertEqual((data['reload'], data['orders']), (True, []))
+        self.assertFalse(self.changes(DataVersion.current())['reload'])
+
+    def test_large_batches_ask_for_a_reload(self):
+        since = DataVersion.current()
+        create_order('#1001')
+        create_order('#1002')
+        with mock.patch('orders.views.ORDER_CHANGES_LIMIT', 1):
+            self.assertTrue(self.changes(since)['reload'])
+        self.assertFalse(self.changes(since)['reload'])
+
+    def test_since_must_be_a_number(self):
+        self.assertEqual(self.client.get(reverse('order_changes'), {'since': 'x'}).status_code, 400)
+
+
+class ToggleTests(SuperuserTestCase):
+    def setUp(self):
+        super().setUp()
+        self.order = create_order('#1001')
+
+    def toggle(self, name, **params):
+        url = reverse(name, args=[self.order.id])
+        return self.client.get(url, params, headers={'Accept': 'application/json'})
+
+    def test_toggle_flips_the_flag(self):
+        self.assertEqual(self.toggle('toggle_order').json(), {'id': self.order.id, 'is_packed': True, 'changed': True})
+        self.assertEqual(self.toggle('toggle_order').json()['is_packed'], False)
+
+    def test_expected_state_is_idempotent(self):
+        for _ in range(2):
+            data = self.toggle('toggle_verify', verified='1').json()
+            self.assertTrue(data['is_verified'])
+        self.assertFalse(data['changed'])
+        self.assertTrue(Order.objects.get().is_verified)
+
+    def test_toggle_stamps_the_version_and_notifies_pages(self):
+        with mock.patch.object(broadcaster, 'publish') as publish:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.toggle('toggle_order', packed='1')
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.version, DataVersion.current())
+        publish.assert_called_once_with({'version': self.order.version})
+
+    def test_no_op_toggle_leaves_the_version_unchanged(self):
+        self.toggle('toggle_order', packed='1')
+        version = DataVersion.current()
+        with mock.patch.object(broadcaster, 'publish') as publish:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.assertFalse(self.toggle('toggle_order', packed='1').json()['changed'])
+        self.assertEqual(DataVersion.current(), version)
+        publish.assert_not_called()
+        self.assertEqual(Order.objects.filter(pk=0).update_tracked(is_packed=True), 0)
+        self.assertEqual(DataVersion.current(), version)
+
+    def test_redirects(self):
+        url = reverse('toggle_order', args=[self.order.id])
+        self.assertRedirects(self.client.get(url), reverse('order_list'), fetch_redirect_response=False)
+        self.assertRedirects(
+            self.client.get(url, {'next': reverse('simplified_view')}), reverse('simplified_view'),
+            fetch_redirect_response=False,
+        )
+        self.assertRedirects(
+            self.client.get(reverse('toggle_verify', args=[self.order.id])),
+            reverse('order_list') + '?status=verification', fetch_redirect_response=False,
+        )
+
+    def test_missing_order(self):
+        Order.objects.filter(id=self.order.id).delete()
+        self.assertEqual(self.toggle('toggle_order').status_code, 404)
+
+
+class BulkUpdateTests(SuperuserTestCase):
+    def bulk(self, action, **data):
+        return self.client.post(
+            reverse('bulk_update_orders'), {'action': action, **data}, headers={'Accept': 'application/json'},
+        )
+
+    def test_selected_ids(self):
+        orders = [create_order(f'#{n}') for n in (1001, 1002, 1003)]
+        start = DataVersion.current()
+        response = self.bulk('pack', ids=[orders[0].id, orders[1].id])
+        self.assertEqual(response.json(), {'updated': 2, 'not_found': []})
+        self.assertEqual(list(Order.objects.order_by('id').values_list('is_packed', flat=True)), [True, True, False])
+        self.assertEqual(DataVersion.current(), start + 1)
+
+    def test_scanned_order_numbers(self):
+        create_order('#1001')
+        create_order('#1002', is_verified=True)
+        create_order('#1003')
+        response = self.bulk('verify', order_numbers='1001\n#1002, 1003 1003\n9999')
+        # #1002 was already verified
+        self.assertEqual(response.json(), {'updated': 2, 'not_found': ['9999']})
+        self.assertEqual(Order.objects.filter(is_verified=True).count(), 3)
+
+    def test_unknown_action(self):
+        self.assertEqual(self.bulk('ship', ids=['1']).status_code, 400)
+
+    def test_form_post_flashes_and_redirects(self):
+        create_order('#1001')
+        response = self.client.post(
+            reverse('bulk_update_orders'),
+            {'action': 'pack', 'order_numbers': '1001 1005', 'next': reverse('order_list') + '?status=packed'},
+            follow=True,
+        )
+        self.assertEqual(response.redirect_chain, [(reverse('order_list') + '?status=packed', 302)])
+        self.assertEqual([str(m) for m in response.context['messages']], ['1 order updated', 'Not found: 1005'])
+
+
+class OrderNumberSequenceTests(TestCase):
+    def test_first_number_without_orders(self):
+        self.assertEqual(OrderNumberSequence.next_number(), '#1001')
+        self.assertEqual(OrderNumberSequence.next_number(), '#1002')
+
+    def test_seeded_from_the_latest_order_format(self):
+        create_order('ORD-7-UK')
+        create_order('ORD-41-UK')
+        create_order('#5000')
+        create_order('ORD-40-UK')
+        self.assertEqual(OrderNumberSequence.next_number(), 'ORD-42-UK')
+
+    def test_latest_order_without_a_number(self):
+        create_order('ABC')
+        self.assertEqual(OrderNumberSequence.reserve(2), ['ABC-1', 'ABC-2'])
+
+    def test_reserves_consecutive_blocks(self):
+        create_order('#1001')
+        self.assertEqual(OrderNumberSequence.reserve(3), ['#1002', '#1003', '#1004'])
+        self.assertEqual(OrderNumberSequence.reserve(2), ['#1005', '#1006'])
+
+    def test_skips_numbers_taken_by_imports(self):
+        create_order('#1001')
+        self.assertEqual(OrderNumberSequence.next_number(), '#1002')
+        import_rows(order_row('#1003', 'Tote Bag'), order_row('#1005', 'Tote Bag'))
+        self.assertEqual(OrderNumberSequence.next_number(), '#1006')
+
+    def test_add_order_uses_the_sequence(self):
+        create_order('#1001')
+        OrderNumberSequence.reserve(4)
+        user = User.objects.create(username='admin', is_staff=True, is_superuser=True)
+        self.client.force_login(user)
+        self.client.post(reverse('add_order'), {
+            'customer_name': 'Jane Smith', 'subtotal': '5.00', 'currency': 'GBP',
+            'items-TOTAL_FORMS': '1', 'items-INITIAL_FORMS': '0',
+            'items-0-product_name': 'Tote Bag', 'items-0-quantity': '1',
+        })
+        self.assertTrue(Order.objects.filter(order_number='#1006').exists())
+
+    def test_reserve_command(self):
+        out = StringIO()
+        call_command('reserve_order_numbers', '2', stdout=out, verbosity=2)
+        self.assertEqual(out.getvalue().splitlines(), ['Reserved 2 order numbers: #1001 to #1002', '#1001', '#1002'])
+        with self.assertRaisesMessage(CommandError, 'count must be at least 1'):
+            call_command('reserve_order_numbers', '0')
+
+
+class OrderStatsTests(SuperuserTestCase):
+    def assertStatsMatchOrders(self):
+        call_command('rebuild_order_stats', '--check', stdout=StringIO())
+
+    def test_saves_and_deletes(self):
+        order = create_order('#1001', subtotal=Decimal('5.50'))
+        create_order('#1002', subtotal=Decimal('4.25'), currency='USD', is_packed=True)
+        self.assertEqual(OrderStats.summary(), {
+            'packed_count': 1, 'unpacked_count': 1, 'verified_count': 0, 'fulfilled_count': 0,
+            'total_revenue': Decimal('9.75'), 'revenue_by_currency': {'GBP': Decimal('5.50'), 'USD': Decimal('4.25')},
+        })
+        order.subtotal = Decimal('7.00')
+        order.is_verified = True
+        order.save()
+        self.assertEqual(OrderStats.summary()['verified_count'], 1)
+        self.assertEqual(OrderStats.summary()['total_revenue'], Decimal('11.25'))
+        self.assertStatsMatchOrders()
+        order.delete()
+        self.assertEqual(OrderStats.summary()['unpacked_count'], 0)
+        self.assertStatsMatchOrders()
+
+    def test_save_and_its_stats_delta_are_one_transaction(self):
+        order = create_order('#1001', subtotal=Decimal('5.50'))
+        version = DataVersion.current()
+        order.is_packed = True
+        with mock.patch.object(OrderStats, 'apply', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                order.save()
+        # The bump and the UPDATE went with the failed delta
+        self.assertEqual(DataVersion.current(), version)
+        self.assertFalse(Order.objects.get().is_packed)
+        self.assertStatsMatchOrders()
+
+    def test_toggles_and_bulk_actions(self):
+        orders = [create_order(f'#{n}', subtotal=Decimal('2.50')) for n in (1001, 1002, 1003)]
+        self.client.get(reverse('toggle_order', args=[orders[0].id]))
+        self.client.get(reverse('toggle_verify', args=[orders[0].id]), {'verified': '1'})
+        self.client.post(reverse('bulk_update_orders'), {'action': 'pack', 'ids': [order.id for order in orders]})
+        summary = OrderStats.summary()
+        self.assertEqual((summary['packed_count'], summary['unpacked_count'], summary['verified_count']), (3, 0, 1))
+        self.assertEqual(summary['total_revenue'], Decimal('7.50'))
+        self.assertStatsMatchOrders()
+
+    def test_imports(self):
+        import_rows(order_row('#1001', 'Tote Bag', Subtotal='10.00'), order_row('#1002', 'Tote Bag', Subtotal='0'))
+        # Re-importing fills in the zero subtotal
+        import_rows(order_row('#1002', 'Tote Bag', Subtotal='3.50'))
+        summary = OrderStats.summary()
+        self.assertEqual((summary['unpacked_count'], summary['total_revenue']), (2, Decimal('13.50')))
+        self.assertStatsMatchOrders()
+
+    def test_dashboard_reads_the_stats(self):
+        create_order('#1001', subtotal=Decimal('5.50'))
+        OrderStats.objects.update(order_count=7)
+        response = self.client.get(reverse('dashboard'))
+        self.assertEqual(response.context['unpacked_count'], 7)
+
+    def test_rebuild_and_check(self):
+        create_order('#1001', subtotal=Decimal('5.50'))
+        OrderStats.objects.update(order_count=7)
+        with self.assertRaisesMessage(CommandError, 'Order statistics are out of date'):
+            self.assertStatsMatchOrders()
+        out = StringIO()
+        call_command('rebuild_order_stats', stdout=out)
+        self.assertIn('Rebuilt order statistics: 1 to pack, 0 packed', out.getvalue())
+        self.assertStatsMatchOrders()
+
+    def test_check_ignores_float_drift_in_summed_subtotals(self):
+        Order.objects.bulk_create([
+            Order(order_number=f'#{1001 + n}', customer_name='Jane Doe', subtotal=Decimal('1234.57'))
+            for n in range(62)
+        ])
+        # SQLite sums these to 76543.3400000001
+        self.assertNotEqual(OrderStats.groups(Order.objects.all())[0]['revenue'], Decimal('76543.34'))
+        call_command('rebuild_order_stats', stdout=StringIO())
+        self.assertEqual(OrderStats.summary()['total_revenue'], Decimal('76543.34'))
+        self.assertStatsMatchOrders()
+
+
+class PageCacheTests(SuperuserTestCase):
+    def setUp(self):
+        super().setUp()
+        create_order('#1001', customer_name='Jane Smith')
+        # The first visit issues the CSRF cookie that HTML pages are keyed on
+        self.client.get(reverse('dashboard'))
+
+    def get(self, url, **params):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return response, len(context)
+
+    def test_pages_are_served_from_the_cache_until_the_data_version_moves(self):
+        url = reverse('order_list')
+        first, rendered = self.get(url, sort='newest')
+        again, cached = self.get(url, sort='newest')
+        self.assertEqual(again.content, first.content)
+        self.assertLess(cached, rendered)
+
+        create_order('#1002', customer_name='Ravi Patel')
+        fresh, queries = self.get(url, sort='newest')
+        self.assertIn(b'Ravi Patel', fresh.content)
+        self.assertEqual(queries, rendered)
+
+    def test_query_string_and_user_are_part_of_the_key(self):
+        url = reverse('order_list')
+        self.get(url, sort='newest')
+        _, queries = self.get(url, sort='oldest')
+        self.assertGreater(queries, self.get(url, sort='oldest')[1])
+
+        self.client.force_login(User.objects.create(username='packer', is_superuser=True))
+        self.client.get(reverse('dashboard'))
+        self.assertEqual(self.get(url, sort='newest')[1], queries)
+
+    def test_flash_messages_bypass_the_cache(self):
+        url = reverse('order_list')
+        self.get(url)
+        self.client.post(reverse('bulk_update_orders'), {'action': 'pack', 'order_numbers': '9999'})
+        response, _ = self.get(url)
+        self.assertContains(response, 'Not found: 9999')
+        # ...and the page without them isn't stored over the cached one
+        self.assertNotContains(self.get(url)[0], 'Not found: 9999')
+
+    def test_only_successful_get_responses_are_stored(self):
+        calls = []
+
+        @cache_by_version(DataVersion.ORDERS, per_user=False)
+        def view(request):
+            calls.append(request.method)
+            return HttpResponse(status=int(request.GET.get('status', 200)))
+
+        factory = RequestFactory()
+        for request in [factory.get('/', {'status': 404})] * 2 + [factory.post('/')] * 2 + [factory.get('/')] * 2:
+            request._messages = []
+            view(request)
+        self.assertEqual(calls, ['GET', 'GET', 'POST', 'POST', 'GET'])
+
+    def test_payment_periods_bump_the_payments_version(self):
+        start = DataVersion.current(DataVersion.PAYMENTS)
+        self.client.get(reverse('payments'))
+        created = DataVersion.current(DataVersion.PAYMENTS)
+        self.assertGreater(created, start)
+        # Revisiting only saves periods whose status changed, i.e. none
+        caches[PAGE_CACHE].clear()
+        self.client.get(reverse('payments'))
+        self.assertEqual(DataVersion.current(DataVersion.PAYMENTS), created)
+
+
+class AnalyticsApiTests(SuperuserTestCase):
+    HARDBACK = BOOK + ' - Hardback'
+    PREORDER = BOOK + ' - Pre-Order'
+
+    def book_order(self, number, days_ago, *items):
+        order = create_order(number, order_date=timezone.now() - timedelta(days=days_ago))
+        for product, quantity in items:
+            LineItem.objects.create(order=order, product_name=product, quantity=quantity)
+        return order
+
+    def analytics(self, **params):
+        response = self.client.get(reverse('analytics_api'), params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def setUp(self):
+        super().setUp()
+        self.book_order('#1001', 2, (self.HARDBACK, 2), ('Tote Bag', 1))
+        self.book_order('#1002', 10, (self.HARDBACK, 1), (self.PREORDER, 3))
+        self.book_order('#1003', 40, (self.PREORDER, 5))
+
+    def test_totals(self):
+        data = self.analytics(period='month')
+        self.assertEqual(data['current'], {'books_sold': 6, 'orders': 2, 'qty_change': 20.0, 'order_change': 100.0})
+        self.assertEqual(data['all_time'], {'books_sold': 11, 'orders': 3})
+        self.assertEqual(data['breakdown'], {'preorder': 8, 'regular': 3})
+        self.assertEqual(self.analytics(period='month', type='preorder')['current']['books_sold'], 3)
+
+    def test_recent_sales_are_the_newest_in_the_period(self):
+        recent = self.analytics(period='month')['recent_sales']
+        self.assertEqual(
+            [(sale['order_number'], sale['quantity'], sale['is_preorder']) for sale in recent],
+            [('#1001', 2, False), ('#1002', 1, False), ('#1002', 3, True)],
+        )
+        recent = self.analytics(period='year', type='regular')['recent_sales']
+        self.assertEqual([sale['order_number'] for sale in recent], ['#1001', '#1002'])
+
+    def test_summary_matches_per_figure_queries(self):
+        for period in ('week', 'month', 'year'):
+            for order_type in ('all', 'preorder', 'regular'):
+                data = self.analytics(period=period, type=order_type)
+                days = {'week': 7, 'month': 30, 'year': 365}[period]
+                start = timezone.now().date() - timedelta(days=days)
+                items = LineItem.objects.filter(product__royalty_bearing=True)
+                if order_type != 'all':
+                    items = items.filter(product__is_preorder=order_type == 'preorder')
+                current = items.filter(order__order_date__date__gte=start)
+                self.assertEqual(data['current']['books_sold'], current.aggregate(total=Sum('quantity'))['total'] or 0)
+                self.assertEqual(data['current']['orders'], current.values('order').distinct().count())
+                self.assertEqual(data['all_time']['books_sold'], items.aggregate(total=Sum('quantity'))['total'])
+                self.assertEqual(data['all_time']['orders'], items.values('order').distinct().count())
+                self.assertEqual(sum(point['value'] for point in data['chart']), data['current']['books_sold'])
+
+    @override_settings(CACHES={
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+        'pages': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+    })
+    def test_summary_and_chart_query_count(self):
+        self.analytics(period='year')
+        # Session, user, data version, the sales engine's versions and recent sales
+        with self.assertNumQueries(5):
+            self.analytics(period='year')
+
+
+
+class SalesEngineTests(TestCase):
+    def setUp(self):
+        self.book = Product.objects.get(name=BOOK)
+        self.preorder = Product.objects.create(name=BOOK + ' - Pre-Order', title=BOOK, is_preorder=True, royalty_bearing=True)
+        self.tote = Product.resolve('Tote Bag')
+        self.now = timezone.now().replace(minute=30, second=0, microsecond=0)
+        for n, (hours_ago, product, quantity) in enumerate([
+            (1, self.book, 2), (1, self.tote, 1), (5, self.preorder, 3), (30, self.book, 1),
+            (24 * 9, self.book, 4), (24 * 40, self.preorder, 2), (24 * 400, self.book, 1),
+        ]):
+            order = create_order(f'#{1001 + n}', order_date=self.now - timedelta(hours=hours_ago))
+            LineItem.objects.create(order=order, product=product, product_name=product.name, quantity=quantity)
+        undated = create_order('#1100')
+        LineItem.objects.create(order=undated, product=self.book, product_name=BOOK, quantity=7)
+        self.engine = SalesEngine().refresh()
+
+    def expected_totals(self, start=None, end=None, products=None, preorder=None):
+        items = LineItem.objects.all()
+        if start:
+            items = items.filter(order__order_date__gte=start)
+        if end:
+            items = items.filter(order__order_date__lt=end)
+        if products is not None:
+            items = items.filter(product__in=products)
+        if preorder is not None:
+            items = items.filter(product__is_preorder=preorder)
+        return {
+            'quantity': items.aggregate(total=Sum('quantity'))['total'] or 0,
+            'orders': items.values('order').distinct().count(),
+        }
+
+    def test_totals_match_the_database(self):
+        books = self.engine.product_ids(royalty_bearing=True)
+        self.assertEqual(sorted(books), sorted([self.book.pk, self.preorder.pk]))
+        ranges = [
+            (None, None), (self.now - timedelta(days=1), None), (self.now - timedelta(days=60), self.now - timedelta(days=7)),
+            (self.now - timedelta(hours=5), self.now - timedelta(hours=1)), (self.now + timedelta(days=1), None),
+        ]
+        for start, end in ranges:
+            for products in (None, books):
+                for preorder in (None, True, False):
+                    self.assertEqual(
+                        self.engine.totals(start, end, products, preorder),
+                        self.expected_totals(start, end, products, preorder),
+                    )
+
+    def test_series_match_the_database(self):
+        start = self.now - timedelta(days=60)
+        end = self.now + timedelta(hours=1)
+        for bucket in ('hour', 'day', 'week', 'month'):
+            series = self.engine.series(start, end, bucket)
+            edges = [edge for edge, total in series] + [end]
+            self.assertEqual(edges[:-1], bucket_edges(start, end, bucket)[:-1])
+            for (edge, total), next_edge in zip(series, edges[1:]):
+                self.assertEqual(total, self.expected_totals(max(edge, start), next_edge)['quantity'], (bucket, edge))
+        self.assertEqual(sum(total for edge, total in self.engine.series(start, end, 'day')), 13)
+
+    def test_refresh_replaces_changed_orders(self):
+        order = Order.objects.get(order_number='#1001')
+        LineItem.objects.create(order=order, product=self.book, product_name=BOOK, quantity=10)
+        self.engine.refresh()
+        self.assertEqual(self.engine.totals(), self.expected_totals())
+        self.preorder.is_preorder = False
+        self.preorder.save()
+        self.engine.refresh()
+        self.assertEqual(self.engine.totals(preorder=True), {'quantity': 0, 'orders': 0})
+        with self.assertNumQueries(1):
+            self.engine.refresh()
+
+    def test_deleted_orders_reload_everything(self):
+        Order.objects.filter(order_number='#1005').delete()
+        Order.objects.get(order_number='#1001').delete()
+        self.engine.refresh()
+        self.assertEqual(self.engine.totals(), self.expected_totals())
+        self.assertEqual(self.engine.totals(self.now - timedelta(days=10))['orders'], 3)
+
+    def test_queries_are_cached_per_version(self):
+        start = self.now - timedelta(days=30)
+        result = self.engine.query(start, self.now, 'day', [self.book.pk])
+        self.assertEqual(result['quantity'], self.expected_totals(start, self.now, [self.book])['quantity'])
+        self.assertEqual(result['series'], self.engine.series(start, self.now, 'day', [self.book.pk]))
+        with self.assertNumQueries(0):
+            self.assertIs(self.engine.query(start, self.now, 'day', [self.book.pk]), result)
+        self.assertNotIn('series', self.engine.query(start, self.now, product_ids=[self.book.pk]))
+
+        LineItem.objects.create(order=Order.objects.get(order_number='#1001'), product=self.book, product_name=BOOK, quantity=10)
+        fresh = self.engine.refresh().query(start, self.now, 'day', [self.book.pk])
+        self.assertEqual(fresh['quantity'], result['quantity'] + 10)
+
+    def test_query_cache_is_bounded(self):
+        with mock.patch.object(SalesEngine, 'QUERY_CACHE_SIZE', 3):
+            first = self.engine.query(self.now - timedelta(days=1))
+            for days in (2, 3, 1, 4):
+                self.engine.query(self.now - timedelta(days=days))
+            # The least recently used entry is dropped, not the oldest
+            starts = [key[1] for key in self.engine._queries]
+            self.assertEqual(starts, [self.now - timedelta(days=days) for days in (3, 1, 4)])
+            self.assertIs(self.engine.query(self.now - timedelta(days=1)), first)
+
+
+class AnalyticsQueryTests(SuperuserTestCase):
+    def setUp(self):
+        super().setUp()
+        Product.objects.create(name=BOOK + ' - Pre-Order', title=BOOK, is_preorder=True, royalty_bearing=True)
+        for number, order_date, product, quantity in [
+            ('#1001', datetime(2026, 6, 1, 9, tzinfo=UTC), BOOK, 2),
+            ('#1002', datetime(2026, 6, 1, 23, 30, tzinfo=UTC), BOOK + ' - Pre-Order', 3),  # 2 June in the UK
+            ('#1003', datetime(2026, 6, 20, 12, tzinfo=UTC), 'Bear Bookmark', 5),
+        ]:
+            order = create_order(number, order_date=order_date)
+            LineItem.objects.create(order=order, product_name=product, quantity=quantity)
+
+    def query(self, status=200, **params):
+        response = self.client.get(reverse('analytics_query'), params)
+        self.assertEqual(response.status_code, status, response.content)
+        return response.json()
+
+    def test_daily_books_in_uk_days(self):
+        data = self.query(start='2026-06-01', end='2026-06-03')
+        self.assertEqual((data['products'], data['books_sold'], data['orders']), ([BOOK], 5, 2))
+        self.assertEqual([point['value'] for point in data['chart']], [2, 3, 0])
+        self.assertEqual(data['chart'][0]['start'], '2026-06-01T00:00:00+01:00')
+        self.assertEqual(self.query(start='2026-06-01', end='2026-06-03', type='preorder')['books_sold'], 3)
+
+    def test_any_title_and_granularity(self):
+        data = self.query(product=['Bear Bookmark', BOOK], start='2026-06-01', end='2026-06-30', granularity='week')
+        self.assertEqual((data['products'], data['books_sold']), (['Bear Bookmark', BOOK], 10))
+        self.assertEqual([point['start'][:10] for point in data['chart']], ['2026-06-01', '2026-06-08', '2026-06-15', '2026-06-22', '2026-06-29'])
+        self.assertEqual(self.query(product='Bear Bookmark', start='2026-06-01', end='2026-06-30', granularity='month')['chart'], [
+            {'start': '2026-06-01T00:00:00+01:00', 'value': 5},
+        ])
+
+    def test_bad_parameters(self):
+        self.query(400, start='June')
+        self.query(400, granularity='minute')
+        self.query(400, type='signed')
+        self.query(400, start='2026-06-03', end='2026-06-01')
+        self.query(400, start='2026-01-01', end='2026-06-01', granularity='hour')
+        self.query(400, product='Unknown Book')
+
+    def test_analytics_api_accepts_titles(self):
+        response = self.client.get(reverse('analytics_api'), {'period': 'year', 'product': 'Bear Bookmark'})
+        data = response.json()
+        self.assertEqual(data['all_time'], {'books_sold': 5, 'orders': 1})
+        self.assertEqual(data['breakdown'], {'preorder': 0, 'regular': 5})
+        self.assertEqual(self.client.get(reverse('analytics_api'), {'product': 'Unknown Book'}).status_code, 400)
+
+
+def local(*args):
+    """An aware datetime in shop time."""
+    return datetime(*args, tzinfo=SHOP_TIMEZONE)
+
+
+class ShopPeriodTests(TestCase):
+    def test_days_start_at_local_midnight_in_bst_and_gmt(self):
+        self.assertEqual(day_range(date(2026, 7, 1), date(2026, 7, 1)), (
+            datetime(2026, 6, 30, 23, tzinfo=UTC), datetime(2026, 7, 1, 23, tzinfo=UTC),
+        ))
+        self.assertEqual(day_range(date(2026, 1, 1), date(2026, 1, 31)), (
+            datetime(2026, 1, 1, tzinfo=UTC), datetime(2026, 2, 1, tzinfo=UTC),
+        ))
+        # Half past midnight in BST is still the previous day in UTC
+        self.assertEqual(shop_date(datetime(2026, 6, 30, 23, 30, tzinfo=UTC)), date(2026, 7, 1))
+        self.assertIsNone(shop_date(None))
+
+    def test_day_and_month_buckets_follow_local_days_across_dst(self):
+        edges = bucket_edges(local(2026, 3, 28, 15), local(2026, 3, 31), 'day')
+        self.assertEqual(edges, [local(2026, 3, day) for day in (28, 29, 30, 31)])
+        # 29 March is a 23 hour day
+        self.assertEqual(edges[2].timestamp() - edges[1].timestamp(), 23 * 3600)
+        edges = bucket_edges(local(2026, 9, 15), local(2026, 11, 2), 'month')
+        self.assertEqual(edges, [local(2026, month, 1) for month in (9, 10, 11, 12)])
+        self.assertEqual(bucket_edges(local(2026, 10, 21, 9), local(2026, 10, 27), 'week'), [
+            local(2026, 10, 19), local(2026, 10, 26), local(2026, 11, 2),
+        ])
+        with self.assertRaises(ValueError):
+            bucket_edges(local(2026, 3, 28), local(2026, 3, 29), 'minute')
+
+    def test_clock_change_days_have_23_and_25_hours(self):
+        spring = bucket_edges(local(2026, 3, 29), local(2026, 3, 30), 'hour')
+        autumn = bucket_edges(local(2026, 10, 25), local(2026, 10, 26), 'hour')
+        self.assertEqual((len(spring) - 1, len(autumn) - 1), (23, 25))
+        for edges in (spring, autumn):
+            self.assertEqual({b.timestamp() - a.timestamp() for a, b in zip(edges, edges[1:])}, {3600})
+
+    def test_books_sold_counts_uk_days(self):
+        book = Product.objects.get(name=BOOK)
+        for number, order_date, quantity in [
+            ('#1001', datetime(2026, 5, 31, 23, 30, tzinfo=UTC), 1),  # 1 June, 00:30 BST
+            ('#1002', datetime(2026, 6, 30, 22, 30, tzinfo=UTC), 2),  # 30 June, 23:30 BST
+            ('#1003', datetime(2026, 6, 30, 23, 30, tzinfo=UTC), 4),  # 1 July, 00:30 BST
+            ('#1004', datetime(2026, 5, 31, 22, 30, tzinfo=UTC), 8),  # 31 May, 23:30 BST
+        ]:
+            order = create_order(number, order_date=order_date)
+            LineItem.objects.create(order=order, product=book, product_name=BOOK, quantity=quantity)
+        june = PaymentPeriod(start_date=date(2026, 6, 1), end_date=date(2026, 6, 30), payment_due_date=date(2026, 7, 31))
+        self.assertEqual(june.books_sold, 3)
+        # In winter a UK day is the UTC day
+        order = create_order('#1005', order_date=datetime(2026, 12, 31, 23, 30, tzinfo=UTC))
+        LineItem.objects.create(order=order, product=book, product_name=BOOK, quantity=16)
+        december = PaymentPeriod(start_date=date(2026, 12, 1), end_date=date(2026, 12, 31), payment_due_date=date(2027, 1, 31))
+        self.assertEqual(december.books_sold, 16)
+
+
+class ProductCatalogTests(TestCase):
+    def test_catalog_is_seeded_with_the_royalty_book(self):
+        book = Product.objects.get(name=PaymentPeriod.BOOK_PRODUCT_NAME)
+        self.assertTrue(book.royalty_bearing)
+
+    def test_classification_from_the_name(self):
+        product = Product.resolve(BOOK + ' - Signed Pre-Order', 'TBE-PRE-SIGNED')
+        self.assertEqual((product.title, product.is_preorder, product.royalty_bearing), (BOOK, True, True))
+        product = Product.resolve('Tote Bag - Large')
+        self.assertEqual((product.title, product.is_preorder, product.royalty_bearing), ('Tote Bag', False, False))
+
+    def test_resolved_by_sku_then_by_name(self):
+        hardback = Product.resolve(BOOK + ' - Hardback', 'TBE-HB')
+        # Shopify renamed the variant: the SKU still finds it
+        self.assertEqual(Product.resolve(BOOK + ' (Hardback)', 'TBE-HB'), hardback)
+        tote = Product.resolve('Tote Bag')
+        self.assertEqual(Product.resolve('Tote Bag', ''), tote)
+        self.assertNotEqual(Product.resolve('Tote Bag', 'TOTE-01'), tote)
+
+    def test_resolve_many(self):
+        tote = Product.resolve('Tote Bag')
+        keys = {('Tote Bag', None), (BOOK, 'TBE-HB'), (BOOK + ' (Hardback)', 'TBE-HB'), ('Postcard', None)}
+        resolved = Product.resolve_many(keys)
+        self.assertEqual(resolved[('Tote Bag', None)], tote)
+        self.assertEqual(resolved[(BOOK, 'TBE-HB')], resolved[(BOOK + ' (Hardback)', 'TBE-HB')])
+        # The seeded book, the tote bag, the hardback and the postcard
+        self.assertEqual(Product.objects.count(), 4)
+        with self.assertNumQueries(2):
+            Product.resolve_many(keys)
+
+    def test_import_and_manual_entry_resolve_products(self):
+        import_rows(order_row('#1001', BOOK, sku='TBE-HB'), order_row('#1001', 'Tote Bag'))
+        order = Order.objects.get()
+        self.assertEqual(
+            sorted(order.items.values_list('product__name', 'product__sku')), [(BOOK, 'TBE-HB'), ('Tote Bag', None)],
+        )
+        item = LineItem.objects.create(order=order, product_name='Postcard', quantity=1)
+        self.assertEqual(item.product, Product.objects.get(name='Postcard'))
+
+    def test_saving_an_item_keeps_its_product_unless_renamed(self):
+        order = create_order('#1001')
+        book = Product.objects.get(name=BOOK)
+        # An explicit product wins over the name it was sold as
+        item = LineItem.objects.create(order=order, product=book, product_name='TBE (gift wrapped)', quantity=1)
+        self.assertEqual(item.product, book)
+        self.assertFalse(Product.objects.filter(name='TBE (gift wrapped)').exists())
+        item.quantity = 2
+        with CaptureQueriesContext(connection) as queries:
+            item.save()
+        self.assertFalse([query for query in queries if 'orders_product' in query['sql']])
+        self.assertEqual(LineItem.objects.get().product, book)
+
+        item.product_name = 'Tote Bag'
+        item.save()
+        self.assertEqual(LineItem.objects.get().product.name, 'Tote Bag')
+        item.product, item.product_name = book, BOOK + ' - Hardback'
+        item.save()
+        self.assertEqual(LineItem.objects.get().product, book)
+
+    def test_royalties_count_by_flag_not_name(self):
+        Product.objects.filter(name=BOOK).update(sku='TBE-HB')
+        book = Product.objects.get(name=BOOK)
+        import_rows(
+            order_row('#1001', 'TBE Hardback (renamed)', quantity=2, sku='TBE-HB', created_at='2026-06-10 10:00:00 +0100'),
+            order_row('#1002', BOOK + ' tote bag', sku='TOTE-TBE', created_at='2026-06-11 10:00:00 +0100'),
+        )
+        period = PaymentPeriod(start_date=date(2026, 6, 1), end_date=date(2026, 6, 30), payment_due_date=date(2026, 7, 31))
+        self.assertEqual(period.books_sold, 2)
+        book.royalty_bearing = False
+        book.save()
+        self.assertEqual(period.books_sold, 0)
+
+    def test_book_variants_bear_royalties_without_an_existing_variant(self):
+        Product.objects.all().delete()
+        product = Product.resolve(BOOK + ' - Signed Pre-Order', 'TBE-PRE-SIGNED')
+        self.assertEqual((product.title, product.is_preorder, product.royalty_bearing), (BOOK, True, True))
+        self.assertFalse(Product.resolve('Tote Bag', 'TOTE-01').royalty_bearing)
+
+    def test_first_import_counts_royalties(self):
+        Product.objects.all().delete()
+        import_rows(
+            order_row('#1001', BOOK, quantity=2, sku='TBE-HB'),
+            order_row('#1002', BOOK + ' - Pre-Order', sku='TBE-PRE'),
+            order_row('#1002', 'Tote Bag', sku='TOTE-01'),
+        )
+        period = PaymentPeriod(start_date=date(2026, 6, 1), end_date=date(2026, 6, 30), payment_due_date=date(2026, 7, 31))
+        self.assertEqual(period.books_sold, 3)
+
+    def test_reclassifying_moves_the_data_version(self):
+        product = Product.resolve('Tote Bag')
+        version = DataVersion.current()
+        product.royalty_bearing = True
+        product.save()
+        self.assertGreater(DataVersion.current(), version)
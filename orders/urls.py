@@ -7,7 +7,10 @@ urlpatterns = [
     path('edit/<int:order_id>/', views.edit_order, name='edit_order'),
     path('simplified/', views.simplified_view, name='simplified_view'),
     path('api/updates/', views.check_updates, name='check_updates'),
+    path('api/events/', views.order_events, name='order_events'),
+    path('api/changes/', views.order_changes, name='order_changes'),
     path('', views.order_list, name='order_list'),
     path('toggle/<int:order_id>/', views.toggle_order, name='toggle_order'),
     path('toggle-verify/<int:order_id>/', views.toggle_verify, name='toggle_verify'),
+    path('bulk/', views.bulk_update_orders, name='bulk_update_orders'),
 ]
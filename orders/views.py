@@ -1,161 +1,281 @@
 from django.shortcuts import render, redirect, get_object_or_404
-from django.db.models import Q, Sum
+from django.template.loader import render_to_string
+from django.urls import reverse
+from django.contrib import messages
 from django.contrib.auth.decorators import login_required, user_passes_test
-from django.http import JsonResponse
-from .models import Order
+from django.db.models import Q
+from django.http import Http404, JsonResponse, HttpResponse, HttpResponseForbidden, StreamingHttpResponse
+from django.core.handlers.asgi import ASGIRequest
+from django.views.decorators.http import etag
+from .events import broadcaster
+from .models import Order, DataVersion, OrderNumberSequence, OrderStats
+from .caching import cache_by_version
 from .forms import OrderForm, LineItemFormSet
+from .pagination import keyset_page
+import asyncio
+import json
 import re
 import time
 
+# Orders shown on the list before "View All", and per infinite-scroll page after it
+ORDER_LIST_PREVIEW = 5
+ORDER_LIST_PAGE_SIZE = 25
+
+# Seconds between keep-alive comments on idle event streams
+EVENT_STREAM_HEARTBEAT = 20
+
+# Most changed orders sent by the changes API before telling clients to reload instead
+ORDER_CHANGES_LIMIT = 100
+
+def orders_etag(request):
+    return f'orders-{DataVersion.current()}'
+
+@etag(orders_etag)
 def check_updates(request):
-    """Returns the timestamp of the last updated order to trigger frontend refreshes."""
-    last_order = Order.objects.all().order_by('-updated_at').first()
-    if last_order:
-        timestamp = last_order.updated_at.timestamp()
-    else:
-        timestamp = 0
-    return JsonResponse({'last_updated': timestamp})
-
-def get_next_order_number():
-    # Find the latest created order to increment from
-    last_order = Order.objects.all().order_by('created_at').last()
-    if not last_order:
-        return "#1001"
-    
-    # Try to extract numbers
-    last_num_str = last_order.order_number
-    match = re.search(r'\d+', last_num_str)
-    if match:
-        num = int(match.group())
-        new_num = num + 1
-        # Preserve prefix if any (e.g., "#" or "ORD")
-        prefix = last_num_str[:match.start()]
-        suffix = last_num_str[match.end():]
-        return f"{prefix}{new_num}{suffix}"
-    else:
-        # Fallback if no number found, append 1
-        return f"{last_num_str}-1"
+    """
+    Returns the orders data version to trigger frontend refreshes. Polls
+    sending If-None-Match with the current version get an empty 304.
+    """
+    return JsonResponse({'version': DataVersion.current()})
+
+@user_passes_test(lambda u: u.is_superuser)
+def order_changes(request):
+    """
+    Orders changed since the client's `since` version, so open pages can patch
+    just those cards instead of reloading. Each order carries its card HTML
+    rendered for the page's `status`, `sort` and `q`.
+    """
+    try:
+        since = int(request.GET.get('since', ''))
+    except ValueError:
+        return JsonResponse({'error': 'since must be a version number'}, status=400)
+
+    # Read the version first: anything committed after this is picked up next time
+    version = DataVersion.current()
+    context = {
+        'filter_status': request.GET.get('status', 'unpacked'),
+        'sort_option': request.GET.get('sort', 'oldest'),
+        'search_query': request.GET.get('q', ''),
+    }
+    changed = list(
+        Order.objects.filter(version__gt=since).for_display().order_by('version')[:ORDER_CHANGES_LIMIT + 1]
+    )
+    # Deletions leave nothing to send, and big batches (imports) are cheaper as a reload
+    reload = since < DataVersion.current(DataVersion.ORDERS_RESET) or len(changed) > ORDER_CHANGES_LIMIT
+
+    return JsonResponse({
+        'version': version,
+        'reload': reload,
+        'orders': [] if reload else [{
+            'id': order.id,
+            'order_number': order.order_number,
+            'is_packed': order.is_packed,
+            'is_verified': order.is_verified,
+            'items': [[item.product_name, item.sku, item.quantity] for item in order.items.all()],
+            'html': render_to_string('orders/includes/order_card.html', dict(context, order=order), request),
+        } for order in changed],
+    })
 
+async def order_events(request):
+    """
+    Server-Sent Events stream pushing {"version": ...} whenever an order
+    changes, so pages don't have to poll check_updates.
+
+    Only works when served over ASGI; under WSGI an open stream would tie up
+    a worker thread, so it answers 204 and the page falls back to polling.
+    """
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse(status=204)
+    user = await request.auser()
+    if not user.is_authenticated:
+        return HttpResponseForbidden()
+
+    async def current_version():
+        return await DataVersion.objects.filter(key=DataVersion.ORDERS).values_list('version', flat=True).afirst() or 0
+
+    async def stream():
+        queue = broadcaster.subscribe()
+        try:
+            # Start with the current state so changes made before connecting aren't missed
+            version = await current_version()
+            yield f"retry: 5000\ndata: {json.dumps({'version': version})}\n\n"
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), EVENT_STREAM_HEARTBEAT)
+                except asyncio.TimeoutError:
+                    # Changes from other processes (e.g. import_orders) never reach the
+                    # broadcaster, so check the counter while idle
+                    latest = await current_version()
+                    if latest == version:
+                        yield ': keep-alive\n\n'
+                        continue
+                    event = {'version': latest}
+                version = max(version, event['version'])
+                yield f'data: {json.dumps(event)}\n\n'
+        finally:
+            broadcaster.unsubscribe(queue)
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Stop proxies buffering the stream
+    return response
 
 @user_passes_test(lambda u: u.is_superuser)
+@cache_by_version(DataVersion.ORDERS)
 def dashboard(request):
-    packed_count = Order.objects.filter(is_packed=True).count()
-    unpacked_count = Order.objects.filter(is_packed=False).count()
-    recent_orders = Order.objects.filter(is_packed=False).order_by('created_at')[:5]
-    
-    total_revenue = Order.objects.aggregate(Sum('subtotal'))['subtotal__sum'] or 0
+    # Counts and revenue come from the materialized stats rows, not the orders table
+    summary = OrderStats.summary()
+    recent_orders = Order.objects.unpacked().sorted_by('oldest')[:5]
     
     return render(request, 'orders/dashboard.html', {
-        'packed_count': packed_count,
-        'unpacked_count': unpacked_count,
+        'packed_count': summary['packed_count'],
+        'unpacked_count': summary['unpacked_count'],
         'recent_orders': recent_orders,
-        'total_revenue': total_revenue
+        'total_revenue': summary['total_revenue'],
+        'revenue_by_currency': summary['revenue_by_currency'],
     })
 
 # Only allow superusers (admins) to access the views
 @user_passes_test(lambda u: u.is_superuser) 
+@cache_by_version(DataVersion.ORDERS)
 def order_list(request):
     filter_status = request.GET.get('status', 'unpacked')
     search_query = request.GET.get('q', '')
     sort_option = request.GET.get('sort', 'oldest')
     
     if filter_status == 'packed':
-        orders = Order.objects.filter(is_packed=True)
+        orders = Order.objects.packed()
     elif filter_status == 'verification':
-        orders = Order.objects.filter(is_packed=True)  # Show all packed orders for verification
+        orders = Order.objects.packed()  # Show all packed orders for verification
     else:
-        orders = Order.objects.filter(is_packed=False)
+        orders = Order.objects.unpacked()
 
-    if search_query:
-        orders = orders.filter(
-            Q(order_number__icontains=search_query) |
-            Q(customer_name__icontains=search_query) |
-            Q(shipping_address__icontains=search_query)
-        )
-        
-    # Apply Sorting
-    if sort_option == 'newest':
-        orders = orders.order_by('-created_at')
-    elif sort_option == 'value_high':
-        orders = orders.order_by('-subtotal')
-    elif sort_option == 'value_low':
-        orders = orders.order_by('subtotal')
-    else: # oldest
-        orders = orders.order_by('created_at')
-
-    # Limit results if not searching and not explicitly viewing all
+    orders = orders.search(search_query).for_display()
+
+    # Limit results if not searching and not explicitly viewing all,
+    # otherwise scroll through keyset pages fetched as HTML fragments
     view_all = request.GET.get('view_all') == 'true'
-    total_count = orders.count()
-    showing_limited = False
+    limited = not search_query and not view_all
+    page = keyset_page(
+        orders, sort_option,
+        ORDER_LIST_PREVIEW if limited else ORDER_LIST_PAGE_SIZE,
+        after=request.GET.get('after'),
+    )
 
-    if not search_query and not view_all:
-        if total_count > 5:
-            orders = orders[:5]
-            showing_limited = True
+    next_page_url = None
+    if page.has_next and not limited:
+        params = request.GET.copy()
+        params['after'] = page.next_cursor
+        params['fragment'] = '1'
+        next_page_url = f"{request.path}?{params.urlencode()}"
 
-    return render(request, 'orders/order_list.html', {
-        'orders': orders, 
+    context = {
+        'orders': page,
         'filter_status': filter_status,
         'search_query': search_query,
         'sort_option': sort_option,
-        'showing_limited': showing_limited,
-        'total_count': total_count
-    })
+        'showing_limited': limited and page.has_next,
+        'view_all': view_all,
+        'next_page_url': next_page_url,
+    }
+    if request.GET.get('fragment'):
+        return render(request, 'orders/includes/order_cards.html', context)
+    if search_query:
+        context['tab_count'] = orders.count()
+    else:
+        # The whole tab, read from the materialized stats rather than counted
+        summary = OrderStats.summary()
+        context['tab_count'] = summary['unpacked_count' if filter_status == 'unpacked' else 'packed_count']
+    return render(request, 'orders/order_list.html', context)
 
-@user_passes_test(lambda u: u.is_superuser)
-def toggle_order(request, order_id):
-    order = get_object_or_404(Order, id=order_id)
-    order.is_packed = not order.is_packed
-    order.save()
-    
+def parse_flag(value):
+    """'1'/'true' -> True, '0'/'false' -> False, anything else -> None (toggle)."""
+    return {'1': True, 'true': True, '0': False, 'false': False}.get((value or '').lower())
+
+def set_order_flag(request, order_id, field, param, default_redirect):
+    """
+    Flip (or, given ?<param>=0/1, set) one of an order's flags in a single
+    conditional UPDATE, so concurrent packers can't cancel each other out.
+    Answers JSON with the resulting state when asked for it, else redirects.
+    """
+    value = parse_flag(request.GET.get(param))
+    changed = Order.objects.filter(id=order_id).set_flag(field, value)
+    state = Order.objects.filter(id=order_id).values_list(field, flat=True).first()
+    if state is None:
+        raise Http404('No order matches the given query.')
+
+    if 'application/json' in request.headers.get('Accept', ''):
+        return JsonResponse({'id': order_id, field: state, 'changed': bool(changed)})
     next_url = request.GET.get('next')
     if next_url:
         return redirect(next_url)
-    return redirect('order_list')
+    return redirect(default_redirect)
+
+@user_passes_test(lambda u: u.is_superuser)
+def toggle_order(request, order_id):
+    return set_order_flag(request, order_id, 'is_packed', 'packed', reverse('order_list'))
 
 @user_passes_test(lambda u: u.is_superuser)
 def toggle_verify(request, order_id):
-    order = get_object_or_404(Order, id=order_id)
-    order.is_verified = not order.is_verified
-    order.save()
-    
-    next_url = request.GET.get('next')
-    if next_url:
-        return redirect(next_url)
-    return redirect('order_list') + '?status=verification'
+    return set_order_flag(request, order_id, 'is_verified', 'verified', reverse('order_list') + '?status=verification')
 
-from django.core.paginator import Paginator
+# Bulk action -> (flag, value) set on every selected or scanned order
+BULK_ACTIONS = {
+    'pack': ('is_packed', True),
+    'unpack': ('is_packed', False),
+    'verify': ('is_verified', True),
+    'unverify': ('is_verified', False),
+}
+
+@user_passes_test(lambda u: u.is_superuser)
+def bulk_update_orders(request):
+    """
+    Apply one action to many orders in a single UPDATE ... WHERE id IN (...).
+
+    Orders come from the `ids` checkboxes on order_list and/or `order_numbers`,
+    a barcode scanner stream of numbers separated by newlines, spaces or
+    commas, with or without the leading '#'.
+    """
+    if request.method != 'POST':
+        return redirect('order_list')
+    action = BULK_ACTIONS.get(request.POST.get('action'))
+    if action is None:
+        return JsonResponse({'error': 'Unknown action'}, status=400)
+
+    ids = [int(order_id) for order_id in request.POST.getlist('ids') if order_id.isdigit()]
+    scanned = list(dict.fromkeys(re.findall(r'[^\s,]+', request.POST.get('order_numbers', ''))))
+    candidates = set(scanned) | {'#' + number for number in scanned if not number.startswith('#')}
+    found = set(Order.objects.filter(order_number__in=candidates).values_list('order_number', flat=True)) if scanned else set()
+    not_found = [number for number in scanned if number not in found and '#' + number not in found]
+
+    field, value = action
+    updated = 0
+    if ids or found:
+        updated = Order.objects.filter(Q(id__in=ids) | Q(order_number__in=found)).set_flag(field, value)
+
+    if 'application/json' in request.headers.get('Accept', ''):
+        return JsonResponse({'updated': updated, 'not_found': not_found})
+    messages.success(request, f"{updated} order{'s' if updated != 1 else ''} updated")
+    if not_found:
+        messages.warning(request, f"Not found: {', '.join(not_found)}")
+    return redirect(request.POST.get('next') or 'order_list')
 
 @user_passes_test(lambda u: u.is_superuser)
 def simplified_view(request):
     search_query = request.GET.get('q', '')
     sort_option = request.GET.get('sort', 'oldest')
 
-    # Base Query: Only unpacked orders
-    orders_list = Order.objects.filter(is_packed=False)
+    # Base Query: Only unpacked orders, matching the search
+    orders_list = Order.objects.unpacked().search(search_query).for_display()
 
-    # Search
-    if search_query:
-        orders_list = orders_list.filter(
-            Q(order_number__icontains=search_query) |
-            Q(customer_name__icontains=search_query) |
-            Q(shipping_address__icontains=search_query)
-        )
-
-    # Sort
-    if sort_option == 'newest':
-        orders_list = orders_list.order_by('-created_at')
-    elif sort_option == 'value_high':
-        orders_list = orders_list.order_by('-subtotal')
-    elif sort_option == 'value_low':
-        orders_list = orders_list.order_by('subtotal')
-    else: # oldest
-        orders_list = orders_list.order_by('created_at')
-    
-    paginator = Paginator(orders_list, 1) # Show 1 order per page
-    
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # Show 1 order per page, addressed by cursor so each swipe is one indexed lookup
+    after = request.GET.get('after')
+    before = request.GET.get('before')
+    page_obj = keyset_page(orders_list, sort_option, 1, after=after, before=before)
+    if not page_obj.object_list and (after or before):
+        # Nothing further in that direction (e.g. the last order was just packed),
+        # so fall back to its neighbour on the other side
+        page_obj = keyset_page(orders_list, sort_option, 1, before=after, after=before)
     
     return render(request, 'orders/simplified.html', {
         'page_obj': page_obj,
@@ -172,7 +292,7 @@ def add_order(request):
         formset = LineItemFormSet(request.POST)
         if form.is_valid() and formset.is_valid():
             order = form.save(commit=False)
-            order.order_number = get_next_order_number()
+            order.order_number = OrderNumberSequence.next_number()
             order.save()
             
             formset.instance = order
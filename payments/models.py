@@ -2,6 +2,7 @@ from django.db import models
 from django.utils import timezone
 from datetime import date
 from calendar import monthrange
+from orders.models import Product
 
 
 class PaymentPeriod(models.Model):
@@ -15,7 +16,7 @@ class PaymentPeriod(models.Model):
     ]
     
     # The book product name to track
-    BOOK_PRODUCT_NAME = "Through Bear's Eyes"
+    BOOK_PRODUCT_NAME = Product.ROYALTY_TITLE
     
     start_date = models.DateField()
     end_date = models.DateField()
@@ -47,22 +48,16 @@ class PaymentPeriod(models.Model):
         """Calculate books sold from orders in this period."""
         from orders.models import LineItem
         from django.db.models import Sum
-        from datetime import datetime, timedelta
+        from orders.periods import day_range
         
-        # Convert dates to datetime for proper filtering
-        start_datetime = datetime.combine(self.start_date, datetime.min.time())
-        # End date should include the entire day
-        end_datetime = datetime.combine(self.end_date + timedelta(days=1), datetime.min.time())
+        # Royalty periods are UK calendar days; compare order_date against the
+        # UTC bounds of the whole local range so the index can be used
+        start_datetime, end_datetime = day_range(self.start_date, self.end_date)
         
-        # Make datetimes timezone-aware
-        from django.utils import timezone as tz
-        start_datetime = tz.make_aware(start_datetime)
-        end_datetime = tz.make_aware(end_datetime)
-        
-        # Count all "Through Bear's Eyes" books sold in this period
+        # Count all royalty-bearing books (Through Bear's Eyes) sold in this period
         # Use order_date (original Shopify date) instead of created_at (import date)
         result = LineItem.objects.filter(
-            product_name__icontains="Through Bear's Eyes",
+            product__royalty_bearing=True,
             order__order_date__gte=start_datetime,
             order__order_date__lt=end_datetime
         ).aggregate(total=Sum('quantity'))
@@ -93,18 +88,21 @@ class PaymentPeriod(models.Model):
             return False
         return date.today() > self.payment_due_date
     
-    def update_status(self):
-        """Update the status based on current date and payment state."""
+    def expected_status(self):
+        """The status implied by the current date and payment state."""
         today = date.today()
         
         if self.paid_date:
-            self.status = 'paid'
+            return 'paid'
         elif today > self.payment_due_date:
-            self.status = 'overdue'
+            return 'overdue'
         elif today > self.end_date:
-            self.status = 'due'
-        else:
-            self.status = 'pending'
+            return 'due'
+        return 'pending'
+    
+    def update_status(self):
+        """Update the status based on current date and payment state."""
+        self.status = self.expected_status()
         self.save()
     
     @classmethod
@@ -174,8 +172,9 @@ class PaymentPeriod(models.Model):
             else:
                 current_month += 1
         
-        # Update statuses for all periods
+        # Update statuses for all periods, only saving the ones that changed
         for period in cls.objects.all():
-            period.update_status()
+            if period.status != period.expected_status():
+                period.update_status()
         
         return periods_created
@@ -0,0 +1,11 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from orders.models import DataVersion
+from .models import PaymentPeriod
+
+
+@receiver(post_save, sender=PaymentPeriod)
+@receiver(post_delete, sender=PaymentPeriod)
+def payment_period_changed(sender, instance, **kwargs):
+    # Invalidates the cached payments dashboard
+    DataVersion.bump(DataVersion.PAYMENTS)
@@ -3,11 +3,15 @@ from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.http import JsonResponse
 from decimal import Decimal, InvalidOperation
+from orders.caching import cache_by_version
+from orders.models import DataVersion
 from .models import PaymentPeriod
 from datetime import date
 
 
 @login_required
+# Royalties are counted from orders, so both versions key the page
+@cache_by_version(DataVersion.ORDERS, DataVersion.PAYMENTS)
 def payments_dashboard(request):
     """Main payments dashboard."""
     # Ensure all periods are created up to current month